@@ -0,0 +1,133 @@
+import glob
+import os
+import queue
+import re
+import threading
+
+import torch
+
+
+def snapshot(obj):
+    """ deep copy of a (nested) state dict with every tensor cloned to the cpu """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return type(obj)((k, snapshot(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+class Checkpointer(object):
+    """ Periodic agent checkpoints written by a background thread.
+
+    save() only snapshots agent.state_dict() (a clone of every tensor,
+    networks, targets and optimizer state) on the calling thread; a
+    writer thread does the torch.save into a temporary file and renames it
+    to ckpt_<step>.pt, so a crash never leaves a truncated checkpoint.
+    If the writer is still busy, a newer snapshot replaces the pending
+    one. The `keep` newest checkpoints are kept.
+    """
+
+    PATTERN = re.compile(r'^ckpt_(\d+)\.pt$')
+
+    def __init__(self, directory, keep=3):
+        self.directory = directory
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        self.pending = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def save(self, agent, step, **extra):
+        item = (step, {'agent': snapshot(agent.state_dict()), 'step': step, 'extra': extra})
+        while True:
+            try:
+                self.pending.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.pending.get_nowait()  # 丢弃还没写的旧快照
+                    self.pending.task_done()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            try:
+                if item is None:
+                    return
+                step, state = item
+                path = os.path.join(self.directory, 'ckpt_{}.pt'.format(step))
+                torch.save(state, path + '.tmp')
+                os.replace(path + '.tmp', path)
+                for old in self.checkpoints()[:-self.keep]:
+                    os.remove(old)
+            except Exception as e:
+                print("checkpoint write failed: {}".format(e))
+            finally:
+                self.pending.task_done()
+
+    def wait(self):
+        """ block until every snapshot taken so far is on disk """
+        self.pending.join()
+
+    def close(self):
+        self.wait()
+        self.pending.put(None)
+        self.thread.join()
+
+    def checkpoints(self):
+        found = []
+        for path in glob.glob(os.path.join(self.directory, 'ckpt_*.pt')):
+            m = self.PATTERN.match(os.path.basename(path))
+            if m:
+                found.append((int(m.group(1)), path))
+        return [path for _, path in sorted(found)]
+
+    def latest(self):
+        paths = self.checkpoints()
+        return paths[-1] if paths else None
+
+
+def load(agent, path, algo=None):
+    """ restore agent from a checkpoint file, returns (step, extra).
+        With algo, a checkpoint saved by another algorithm raises ValueError """
+    try:
+        state = torch.load(path, map_location='cpu', weights_only=False)
+    except TypeError:  # torch < 1.13
+        state = torch.load(path, map_location='cpu')
+    saved = state['extra'].get('algo')
+    if algo is not None and saved is not None and saved != algo:
+        raise ValueError("{} is a {} checkpoint, not {}".format(path, saved, algo))
+    agent.load_state_dict(state['agent'])
+    return state['step'], state['extra']
+
+
+def benchmark(n=20):
+    """ time on the control loop (snapshot) against a synchronous torch.save """
+    import tempfile
+    import time
+    import numpy as np
+    from gym import spaces
+    from ddpg_cnn import DDPG_CNN
+
+    agent = DDPG_CNN(0.99, 0.001, 128, 26, spaces.Box(np.array([1]), np.array([4])))
+    directory = tempfile.mkdtemp()
+    ckpt = Checkpointer(directory)
+    start = time.perf_counter()
+    for i in range(n):
+        ckpt.save(agent, i)
+    t_async = (time.perf_counter() - start) / n * 1e3
+    ckpt.close()
+    start = time.perf_counter()
+    for i in range(n):
+        torch.save({'agent': agent.state_dict()}, os.path.join(directory, 'sync.pt'))
+    t_sync = (time.perf_counter() - start) / n * 1e3
+    print("save on the control loop: {:.2f} ms, synchronous torch.save: {:.2f} ms".format(t_async, t_sync))
+
+
+if __name__ == '__main__':
+    benchmark()
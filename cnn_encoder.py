@@ -0,0 +1,60 @@
+import torch
+import torch.nn as nn
+
+
+class GroupedConvEncoder(nn.Module):
+    """ Convolutional front-end of the CNN policies.
+
+    Input is (batch, subflows, num_inputs): every row is one subflow whose
+    first groups * k values are `groups` time series of length k
+    (throughput, rtt, cwnd, ...) followed by the other features. Each
+    series group is convolved over time with the subflows as channels,
+    and all groups run in one grouped Conv1d, so a whole minibatch goes
+    through in a single pass. Every group is then projected back to k
+    values per subflow and the untouched features are appended, so the
+    output has the same shape as the input. A (batch, subflows, groups, k)
+    tensor of only the series is accepted too and comes back flattened
+    to (batch, subflows, groups * k). Zero-padded subflow rows stay
+    separate channels, so padding does not mix into the real ones.
+    """
+
+    def __init__(self, subflows, k, groups, channels=16):
+        super(GroupedConvEncoder, self).__init__()
+        self.subflows = subflows
+        self.k = k
+        self.groups = groups
+        self.channels = channels
+
+        self.conv = nn.Sequential(
+            nn.Conv1d(
+                in_channels=groups * subflows,
+                out_channels=groups * channels,
+                kernel_size=4,
+                stride=1,
+                padding=1,
+                groups=groups,
+            ),
+            nn.ReLU(),
+            nn.MaxPool1d(kernel_size=2),
+        )
+        conv_len = (k - 1) // 2
+        # one Linear(channels * conv_len, subflows * k) per group
+        self.out = nn.Conv1d(groups * channels * conv_len, groups * subflows * k,
+                             kernel_size=1, groups=groups)
+
+    def forward(self, inputs):
+        batch = inputs.size(0)
+        width = self.groups * self.k
+        if inputs.dim() == 4:
+            inputs = inputs.reshape(batch, self.subflows, width)
+
+        x = inputs[:, :, :width].contiguous()
+        x = x.view(batch, self.subflows, self.groups, self.k).transpose(1, 2)
+        x = x.contiguous().view(batch, self.groups * self.subflows, self.k)
+        x = self.conv(x)
+        x = x.view(batch, -1, 1)
+        x = self.out(x)
+        x = x.view(batch, self.groups, self.subflows, self.k).transpose(1, 2)
+        x = x.contiguous().view(batch, self.subflows, width)
+
+        return torch.cat((x, inputs[:, :, width:]), 2)
@@ -5,20 +5,11 @@ import torch.nn as nn
 from torch.optim import Adam
 from torch.autograd import Variable
 import torch.nn.functional as F
+from target_update import soft_update, hard_update
 
 MSELoss = nn.MSELoss()
 
 
-def soft_update(target, source, tau):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
-
-
-def hard_update(target, source):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(param.data)
-
-
 class Actor(nn.Module):
 
     def __init__(self, hidden_size, num_inputs, action_space):
@@ -96,6 +87,9 @@ class Critic(nn.Module):
 
 
 class DDPG(object):
+    action_bounds = (0, 4)  # select_action clamps to [low, high]
+    mask = False  # one row per sample, no padded rows
+
     def __init__(self, gamma, tau, hidden_size, num_inputs, action_space):
         self.num_inputs = num_inputs
         self.action_space = action_space
@@ -114,6 +108,24 @@ class DDPG(object):
         hard_update(self.actor_target, self.actor)  # Make sure target is with the same weight
         hard_update(self.critic_target, self.critic)
 
+    def state_dict(self):
+        return {
+            'actor': self.actor.state_dict(),
+            'actor_target': self.actor_target.state_dict(),
+            'actor_optim': self.actor_optim.state_dict(),
+            'critic': self.critic.state_dict(),
+            'critic_target': self.critic_target.state_dict(),
+            'critic_optim': self.critic_optim.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.actor.load_state_dict(state['actor'])
+        self.actor_target.load_state_dict(state['actor_target'])
+        self.actor_optim.load_state_dict(state['actor_optim'])
+        self.critic.load_state_dict(state['critic'])
+        self.critic_target.load_state_dict(state['critic_target'])
+        self.critic_optim.load_state_dict(state['critic_optim'])
+
     def select_action(self, state, exploration=None):
         self.actor.eval()
         mu = self.actor((Variable(state, volatile=True)))
@@ -122,14 +134,16 @@ class DDPG(object):
         if exploration is not None:
             mu += torch.Tensor(exploration.noise())
 
-        return mu.clamp(0, 4)
+        return mu.clamp(*self.action_bounds)
 
-    def update_parameters(self, batch):
-        state_batch = Variable(torch.cat(batch.state))
-        next_state_batch = Variable(torch.cat(batch.next_state), volatile=True)
-        action_batch = Variable(torch.cat(batch.action))
-        reward_batch = Variable(torch.cat(batch.reward))
-        mask_batch = Variable(torch.cat(batch.mask))
+    def update_parameters(self, batch, weights=None):
+        """ one gradient step, returns the absolute TD error of every transition.
+            weights are importance-sampling weights of a prioritized sample """
+        state_batch = Variable(batch.state)
+        next_state_batch = Variable(batch.next_state, volatile=True)
+        action_batch = Variable(batch.action)
+        reward_batch = Variable(batch.reward)
+        mask_batch = Variable(batch.mask)
 
         next_action_batch = self.actor_target(next_state_batch)
         next_state_action_values = self.critic_target(next_state_batch, next_action_batch)
@@ -141,7 +155,11 @@ class DDPG(object):
 
         state_action_batch = self.critic((state_batch), (action_batch))
 
-        value_loss = MSELoss(state_action_batch, expected_state_action_batch)
+        if weights is None:
+            value_loss = MSELoss(state_action_batch, expected_state_action_batch)
+        else:
+            weights = Variable(weights).view(-1, 1)
+            value_loss = (weights * (state_action_batch - expected_state_action_batch) ** 2).mean()
         value_loss.backward()
         self.critic_optim.step()
 
@@ -155,3 +173,6 @@ class DDPG(object):
 
         soft_update(self.actor_target, self.actor, self.tau)
         soft_update(self.critic_target, self.critic, self.tau)
+
+        td = (expected_state_action_batch - state_action_batch).data
+        return td.view(-1).abs()
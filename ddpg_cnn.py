@@ -5,52 +5,21 @@ import torch.nn as nn
 from torch.optim import Adam
 from torch.autograd import Variable
 import torch.nn.functional as F
+from cnn_encoder import GroupedConvEncoder
+from target_update import soft_update, hard_update
 
 MSELoss = nn.MSELoss()
 
-def soft_update(target, source, tau):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
-
-def hard_update(target, source):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(param.data)
-
 
 class Actor(nn.Module):
 
-    def __init__(self, hidden_size, num_inputs, action_space):
+    def __init__(self, hidden_size, num_inputs, action_space, subflows=2, k=8):
         super(Actor, self).__init__()
         self.action_space = action_space
         num_outputs = action_space.shape[0]
         
-        self.conv1 = nn.Sequential(         
-            nn.Conv1d(
-                in_channels=2,              
-                out_channels=16,            
-                kernel_size=4,             
-                stride=1,                   
-                padding=1,                 
-            ),                              
-            nn.ReLU(),                      
-            nn.MaxPool1d(kernel_size=2),    
-        )
-        self.out1 = nn.Linear(48, 16)   
-        
-        self.conv2 = nn.Sequential(         
-            nn.Conv1d(
-                in_channels=2,              
-                out_channels=16,            
-                kernel_size=4,             
-                stride=1,                   
-                padding=1,                 
-            ),                              
-            nn.ReLU(),                      
-            nn.MaxPool1d(kernel_size=2),    
-        )
-        self.out2 = nn.Linear(48, 16) 
-        
-        
+        self.subflows = subflows
+        self.encoder = GroupedConvEncoder(subflows, k, groups=2)
 
         self.bn0 = nn.BatchNorm1d(num_inputs)
         self.bn0.weight.data.fill_(1)
@@ -73,24 +42,10 @@ class Actor(nn.Module):
 
     def forward(self, inputs):
     
-        cnn1 = inputs[:, 0:8].contiguous()
-        cnn1 = cnn1.view(1,2,8)
-        cnn1 = self.conv1(cnn1)
-        cnn1 = cnn1.view(cnn1.size(0), -1)
-        cnn1 = self.out1(cnn1)
-        cnn1 = cnn1.view(2,8)
-        
-        cnn2 = inputs[:, 8:16].contiguous()
-        cnn2 = cnn2.view(1,2,8)
-        cnn2 = self.conv2(cnn2)
-        cnn2 = cnn2.view(cnn2.size(0), -1)
-        cnn2 = self.out2(cnn2)
-        cnn2 = cnn2.view(2,8)
-        
-        x = torch.cat((cnn1,cnn2), 1)
-        x = torch.cat((x,inputs[:,16:]), 1)
-        
-        
+        x = inputs.view(-1, self.subflows, inputs.size(-1))
+        x = self.encoder(x)
+        x = x.view(-1, x.size(-1))
+
         x = self.bn0(x)
         x = F.tanh(self.linear1(x))
         x = F.tanh(self.linear2(x))
@@ -101,37 +56,14 @@ class Actor(nn.Module):
     
 class Critic(nn.Module):
 
-    def __init__(self, hidden_size, num_inputs, action_space):
+    def __init__(self, hidden_size, num_inputs, action_space, subflows=2, k=8):
         super(Critic, self).__init__()
         self.action_space = action_space
         num_outputs = action_space.shape[0]
         
-        self.conv1 = nn.Sequential(         
-            nn.Conv1d(
-                in_channels=2,              
-                out_channels=16,            
-                kernel_size=4,             
-                stride=1,                   
-                padding=1,                 
-            ),                              
-            nn.ReLU(),                      
-            nn.MaxPool1d(kernel_size=2),    
-        )
-        self.out1 = nn.Linear(48, 16)   
-        
-        self.conv2 = nn.Sequential(         
-            nn.Conv1d(
-                in_channels=2,              
-                out_channels=16,            
-                kernel_size=4,             
-                stride=1,                   
-                padding=1,                 
-            ),                              
-            nn.ReLU(),                      
-            nn.MaxPool1d(kernel_size=2),    
-        )
-        self.out2 = nn.Linear(48, 16)         
-        
+        self.subflows = subflows
+        self.encoder = GroupedConvEncoder(subflows, k, groups=2)
+
         self.bn0 = nn.BatchNorm1d(num_inputs)
         self.bn0.weight.data.fill_(1)
         self.bn0.bias.data.fill_(0)
@@ -156,23 +88,10 @@ class Critic(nn.Module):
         self.V.bias.data.mul_(0.1)
 
     def forward(self, inputs, actions):
-        cnn1 = inputs[:, 0:8].contiguous()
-        cnn1 = cnn1.view(1,2,8)
-        cnn1 = self.conv1(cnn1)
-        cnn1 = cnn1.view(cnn1.size(0), -1)
-        cnn1 = self.out1(cnn1)
-        cnn1 = cnn1.view(2,8)
-        
-        cnn2 = inputs[:, 8:16].contiguous()
-        cnn2 = cnn2.view(1,2,8)
-        cnn2 = self.conv2(cnn2)
-        cnn2 = cnn2.view(cnn2.size(0), -1)
-        cnn2 = self.out2(cnn2)
-        cnn2 = cnn2.view(2,8)
-        
-        x = torch.cat((cnn1,cnn2), 1)
-        x = torch.cat((x,inputs[:,16:]), 1)        
-        
+        x = inputs.view(-1, self.subflows, inputs.size(-1))
+        x = self.encoder(x)
+        x = x.view(-1, x.size(-1))
+
         x = self.bn0(x)
         x = F.tanh(self.linear1(x))
         a = F.tanh(self.linear_action(actions))
@@ -184,17 +103,21 @@ class Critic(nn.Module):
 
 
 class DDPG_CNN(object):
-    def __init__(self, gamma, tau, hidden_size, num_inputs, action_space):
+    action_bounds = (0, 4)  # select_action clamps to [low, high]
+
+    def __init__(self, gamma, tau, hidden_size, num_inputs, action_space, subflows=2, k=8, mask=False):
 
         self.num_inputs = num_inputs
         self.action_space = action_space
+        self.subflows = subflows
+        self.mask = mask  # 最后一列是 active，补齐的子流动作为0、不参与损失
 
-        self.actor = Actor(hidden_size, self.num_inputs, self.action_space)
-        self.actor_target = Actor(hidden_size, self.num_inputs, self.action_space)
+        self.actor = Actor(hidden_size, self.num_inputs, self.action_space, subflows, k)
+        self.actor_target = Actor(hidden_size, self.num_inputs, self.action_space, subflows, k)
         self.actor_optim = Adam(self.actor.parameters(), lr=1e-4)
 
-        self.critic = Critic(hidden_size, self.num_inputs, self.action_space)
-        self.critic_target = Critic(hidden_size, self.num_inputs, self.action_space)
+        self.critic = Critic(hidden_size, self.num_inputs, self.action_space, subflows, k)
+        self.critic_target = Critic(hidden_size, self.num_inputs, self.action_space, subflows, k)
         self.critic_optim = Adam(self.critic.parameters(), lr=1e-3)
 
         self.gamma = gamma
@@ -204,6 +127,24 @@ class DDPG_CNN(object):
         hard_update(self.critic_target, self.critic)
 
 
+    def state_dict(self):
+        return {
+            'actor': self.actor.state_dict(),
+            'actor_target': self.actor_target.state_dict(),
+            'actor_optim': self.actor_optim.state_dict(),
+            'critic': self.critic.state_dict(),
+            'critic_target': self.critic_target.state_dict(),
+            'critic_optim': self.critic_optim.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.actor.load_state_dict(state['actor'])
+        self.actor_target.load_state_dict(state['actor_target'])
+        self.actor_optim.load_state_dict(state['actor_optim'])
+        self.critic.load_state_dict(state['critic'])
+        self.critic_target.load_state_dict(state['critic_target'])
+        self.critic_optim.load_state_dict(state['critic_optim'])
+
     def select_action(self, state, exploration=None):
         self.actor.eval()
         mu = self.actor((Variable(state, volatile=True)))
@@ -212,27 +153,44 @@ class DDPG_CNN(object):
         if exploration is not None:
             mu += torch.Tensor(exploration.noise())
 
-        return mu.clamp(0, 4)
+        mu = mu.clamp(*self.action_bounds)
+        if self.mask:
+            mu.mul_(state[..., -1:])
+        return mu
 
 
-    def update_parameters(self, batch):
-        state_batch = Variable(torch.cat(batch.state))
-        next_state_batch = Variable(torch.cat(batch.next_state), volatile=True)
-        action_batch = Variable(torch.cat(batch.action))
-        reward_batch = Variable(torch.cat(batch.reward))
-        mask_batch = Variable(torch.cat(batch.mask))
+    def update_parameters(self, batch, weights=None):
+        """ one gradient step, returns the absolute TD error of every transition.
+            weights are importance-sampling weights of a prioritized sample """
+        state_batch = Variable(batch.state)
+        next_state_batch = Variable(batch.next_state, volatile=True)
+        action_batch = Variable(batch.action)
+        reward_batch = Variable(batch.reward)
+        mask_batch = Variable(batch.mask)
 
         next_action_batch = self.actor_target(next_state_batch)
         next_state_action_values = self.critic_target(next_state_batch, next_action_batch)
 
-        reward_batch = torch.unsqueeze(reward_batch, 1)
+        # one row per subflow, every subflow of a transition shares its reward
+        reward_batch = reward_batch.view(-1, 1).repeat(1, self.subflows).view(-1, 1)
         expected_state_action_batch = reward_batch + (self.gamma * next_state_action_values)
 
         self.critic_optim.zero_grad()
 
         state_action_batch = self.critic((state_batch), (action_batch))
 
-        value_loss = MSELoss(state_action_batch, expected_state_action_batch)
+        if weights is not None:
+            weights = Variable(weights).view(-1, 1).repeat(1, self.subflows).view(-1, 1)
+        if self.mask:
+            active = state_batch[:, -1:]
+            weights = active if weights is None else weights * active
+            scale = active.numel() / active.sum().clamp(min=1)  # 只对真实子流求平均
+        if weights is None:
+            value_loss = MSELoss(state_action_batch, expected_state_action_batch)
+        else:
+            value_loss = (weights * (state_action_batch - expected_state_action_batch) ** 2).mean()
+        if self.mask:
+            value_loss = value_loss * scale
         value_loss.backward()
         self.critic_optim.step()
 
@@ -240,9 +198,18 @@ class DDPG_CNN(object):
 
         policy_loss = -self.critic((state_batch),self.actor((state_batch)))
 
-        policy_loss = policy_loss.mean()
+        if self.mask:
+            policy_loss = (policy_loss * active).mean() * scale
+        else:
+            policy_loss = policy_loss.mean()
         policy_loss.backward()
         self.actor_optim.step()
 
         soft_update(self.actor_target, self.actor, self.tau)
         soft_update(self.critic_target, self.critic, self.tau)
+
+        td = (expected_state_action_batch - state_action_batch).data.abs()
+        if self.mask:
+            active = active.data.view(-1, self.subflows)
+            return (td.view(-1, self.subflows) * active).sum(1) / active.sum(1).clamp(min=1)
+        return td.view(-1, self.subflows).mean(1)
@@ -0,0 +1,135 @@
+import copy
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+
+_inference_mode = getattr(torch, 'inference_mode', torch.no_grad)
+
+
+class _Mu(nn.Module):
+    """ NAF Policy takes (state, u) and returns (mu, Q, V), keep only mu """
+
+    def __init__(self, model):
+        super(_Mu, self).__init__()
+        self.model = model
+
+    def forward(self, inputs):
+        return self.model((inputs, None))[0]
+
+
+class LatencyHistogram(object):
+    """ power-of-two buckets of per-decision latency in nanoseconds """
+
+    def __init__(self, buckets=40):
+        self.counts = np.zeros(buckets, dtype=np.int64)
+        self.total = 0
+        self.max = 0
+
+    def reset(self):
+        self.counts.fill(0)
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns):
+        self.counts[min(int(ns).bit_length(), len(self.counts) - 1)] += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        """ upper bound (us) of the bucket holding the q-th percentile """
+        n = self.counts.sum()
+        if n == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * n))
+        return (1 << i) / 1e3
+
+    def stats(self):
+        n = int(self.counts.sum())
+        return {
+            'decisions': n,
+            'mean_us': self.total / n / 1e3 if n else 0.0,
+            'p50_us': self.percentile(50),
+            'p99_us': self.percentile(99),
+            'max_us': self.max / 1e3,
+        }
+
+
+class InferencePolicy(object):
+    """ Frozen copy of an agent's acting network for the control loop.
+
+    The network (actor for DDPG, mu head of model for NAF) is deep-copied,
+    put in eval mode once and traced with torch.jit, so a decision is one
+    call of a fused graph under inference_mode: no eval()/train() toggles,
+    no autograd bookkeeping. The state is copied into a preallocated input
+    buffer, noise is added and the action clamped in place in a
+    preallocated output, which is returned and overwritten by the next
+    call. For a masked agent the padded subflow rows get 0. Every decision
+    is timed into `latency`.
+    """
+
+    def __init__(self, agent, example, trace=True):
+        net = agent.actor if hasattr(agent, 'actor') else _Mu(agent.model)
+        self.net = copy.deepcopy(net).eval()
+        for p in self.net.parameters():
+            p.requires_grad_(False)
+        self.low, self.high = agent.action_bounds
+        self.mask = agent.mask
+
+        self.input = example.detach().clone()
+        self.fn = self.net
+        with _inference_mode():
+            if trace:
+                try:
+                    traced = torch.jit.trace(self.net, (self.input,), check_trace=False)
+                    self.fn = torch.jit.freeze(traced) if hasattr(torch.jit, 'freeze') else traced
+                except Exception as e:
+                    print("InferencePolicy: tracing failed ({}), running eagerly".format(e))
+            self.output = self.fn(self.input).clone()
+        self.latency = LatencyHistogram()
+
+    def select_action(self, state, exploration=None):
+        start = time.perf_counter_ns()
+        with _inference_mode():
+            self.input.copy_(state)
+            self.output.copy_(self.fn(self.input))
+            if exploration is not None:
+                self.output.add_(torch.from_numpy(np.asarray(exploration.noise(), dtype=np.float32)))
+            self.output.clamp_(self.low, self.high)
+            if self.mask:
+                self.output.mul_(self.input[..., -1:])
+        self.latency.record(time.perf_counter_ns() - start)
+        return self.output
+
+
+def benchmark(n=10000, hidden_size=128, subflows=2, k=8):
+    """ per decision latency of agent.select_action vs InferencePolicy """
+    from gym import spaces
+    from naf_cnn import NAF_CNN
+    from ddpg_cnn import DDPG_CNN
+
+    torch.set_num_threads(1)
+    num_inputs = 3 * k + 2
+    action_space = spaces.Box(np.array([1]), np.array([4]))
+    state = torch.rand(subflows, num_inputs)
+    for cls in (NAF_CNN, DDPG_CNN):
+        agent = cls(0.99, 0.001, hidden_size, num_inputs, action_space, subflows, k)
+        fast = InferencePolicy(agent, state)
+        assert torch.allclose(agent.select_action(state), fast.select_action(state), atol=1e-5)
+
+        start = time.perf_counter()
+        for _ in range(n):
+            agent.select_action(state)
+        slow = (time.perf_counter() - start) / n * 1e6
+
+        fast.latency.reset()
+        for _ in range(n):
+            fast.select_action(state)
+        print("{:>8}: select_action {:7.1f} us, InferencePolicy {}".format(cls.__name__, slow, fast.latency.stats()))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,92 @@
+import copy
+import queue
+import threading
+import time
+
+
+class Learner(threading.Thread):
+    """ Runs update_parameters in its own thread.
+
+    The control loop pushes transitions through push() and acts with
+    `policy`, a copy of the agent whose acting network is a frozen
+    snapshot. The learner publishes a fresh snapshot every
+    `publish_every` updates by rebinding `policy`, so the control loop
+    always sees a complete network and never waits for a gradient step.
+    With updates_per_step set, the learner does at most that many
+    updates per transition pushed once the memory holds more than
+    warmup transitions, like the inline loop did.
+    checkpoint() hands a save to the learner thread, which takes the
+    snapshot between two updates, so a checkpoint never mixes parameters
+    of different steps.
+    """
+
+    def __init__(self, agent, memory, batch_size, warmup, publish_every=10, updates_per_step=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.agent = agent
+        self.memory = memory
+        self.batch_size = batch_size
+        self.warmup = warmup
+        self.publish_every = publish_every
+        self.updates_per_step = updates_per_step
+        self.policy_attr = 'actor' if hasattr(agent, 'actor') else 'model'
+
+        self.lock = threading.Lock()  # memory is shared with the control loop
+        self.stop_event = threading.Event()
+        self.checkpoints = queue.Queue()
+        self.pushes = 0  # warmup之后push的transition数
+        self.updates = 0
+        self.policy = self.snapshot()
+
+    def snapshot(self):
+        policy = copy.copy(self.agent)
+        setattr(policy, self.policy_attr, copy.deepcopy(getattr(self.agent, self.policy_attr)))
+        return policy
+
+    def push(self, *args):
+        with self.lock:
+            self.memory.push(*args)
+            if len(self.memory) > self.warmup:
+                self.pushes += 1
+
+    def select_action(self, state, exploration=None):
+        return self.policy.select_action(state, exploration)
+
+    def checkpoint(self, checkpointer, step, **extra):
+        """ checkpointer.save(agent, step, **extra) on the learner thread, between updates """
+        self.checkpoints.put((checkpointer, step, extra))
+
+    def _save_checkpoints(self):
+        while True:
+            try:
+                checkpointer, step, extra = self.checkpoints.get_nowait()
+            except queue.Empty:
+                return
+            checkpointer.save(self.agent, step, **extra)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self._save_checkpoints()
+            if len(self.memory) <= self.warmup or \
+                    (self.updates_per_step is not None and self.updates >= self.updates_per_step * self.pushes):
+                time.sleep(0.001)
+                continue
+            if hasattr(self.memory, 'sample_prioritized'):
+                with self.lock:
+                    batch, idx, weights = self.memory.sample_prioritized(self.batch_size)
+                td = self.agent.update_parameters(batch, weights)
+                with self.lock:
+                    self.memory.update_priorities(idx, td)
+            else:
+                with self.lock:
+                    batch = self.memory.sample(self.batch_size)
+                self.agent.update_parameters(batch)
+            self.updates += 1
+            if self.updates % self.publish_every == 0:
+                self.policy = self.snapshot()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self._save_checkpoints()  # 线程已结束，剩下的请求在这里保存
+        self.policy = self.snapshot()
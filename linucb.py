@@ -0,0 +1,89 @@
+import itertools
+
+import numpy as np
+import torch
+
+
+class LinUCB(object):
+    """ Disjoint LinUCB over discretized set_seg segment splits.
+
+    Every arm is one combination of per-subflow segment counts taken from
+    the integer levels of action_space. The context is the flattened env
+    state, log1p-compressed because the counters are heavy tailed, plus a
+    bias term. Each arm keeps A^-1 and theta = A^-1 b; an observed reward
+    updates them with a Sherman-Morrison rank-1 step, O(d^2) instead of a
+    new inversion, and select_action scores every arm in one batched
+    matrix-vector product. There is nothing to train by gradient, so
+    update_parameters is meant to see every transition exactly once.
+    With mask the last feature of every row marks a real subflow: only
+    arms with the lowest level on the padded rows are played, and those
+    rows get a 0 action.
+    """
+
+    def __init__(self, alpha, num_inputs, action_space, subflows=2, levels=None, ridge=1.0, mask=False):
+        self.action_space = action_space
+        self.num_inputs = num_inputs
+        self.subflows = subflows
+        self.alpha = alpha
+        self.mask = mask
+
+        if levels is None:
+            levels = np.arange(int(action_space.low[0]), int(action_space.high[0]) + 1)
+        self.levels = np.asarray(levels, dtype=np.float32)
+        self.arms = np.array(list(itertools.product(self.levels, repeat=subflows)), dtype=np.float32)
+        self.radix = len(self.levels) ** np.arange(subflows - 1, -1, -1)
+
+        num_arms = len(self.arms)
+        self.dim = subflows * num_inputs + 1
+        self.A_inv = np.tile(np.eye(self.dim) / ridge, (num_arms, 1, 1))
+        self.b = np.zeros((num_arms, self.dim))
+        self.theta = np.zeros((num_arms, self.dim))
+        self.x = np.ones(self.dim)
+
+    def state_dict(self):
+        return {name: torch.from_numpy(getattr(self, name).copy()) for name in ('A_inv', 'b', 'theta')}
+
+    def load_state_dict(self, state):
+        for name in ('A_inv', 'b', 'theta'):
+            getattr(self, name)[...] = state[name].numpy()
+
+    def context(self, state, out=None):
+        if out is None:
+            out = np.ones(self.dim)
+        np.log1p(np.maximum(np.asarray(state, dtype=np.float64).reshape(-1), 0), out=out[:-1])
+        return out
+
+    def scores(self, x):
+        width = self.A_inv.dot(x).dot(x)
+        return self.theta.dot(x) + self.alpha * np.sqrt(np.maximum(width, 0))
+
+    def arm_index(self, actions):
+        """ (n, subflows) actions -> arm of the nearest levels """
+        level = np.abs(actions[..., None] - self.levels).argmin(-1)
+        return level.dot(self.radix)
+
+    def select_action(self, state, exploration=None):
+        scores = self.scores(self.context(state, self.x))
+        if self.mask:
+            active = np.asarray(state).reshape(self.subflows, -1)[:, -1] > 0
+            scores[(self.arms[:, ~active] != self.levels[0]).any(1)] = -np.inf
+            arm = int(np.argmax(scores))
+            return torch.from_numpy((self.arms[arm] * active).reshape(self.subflows, 1))
+        arm = int(np.argmax(scores))
+        return torch.from_numpy(self.arms[arm].reshape(self.subflows, 1).copy())
+
+    def update(self, x, arm, reward):
+        A_inv = self.A_inv[arm]
+        Ax = A_inv.dot(x)
+        A_inv -= np.outer(Ax, Ax) / (1.0 + x.dot(Ax))
+        self.b[arm] += reward * x
+        self.theta[arm] = A_inv.dot(self.b[arm])
+
+    def update_parameters(self, batch):
+        states = np.asarray(batch.state, dtype=np.float64).reshape(-1, self.subflows * self.num_inputs)
+        actions = np.asarray(batch.action, dtype=np.float64).reshape(-1, self.subflows)
+        rewards = np.asarray(batch.reward, dtype=np.float64).reshape(-1)
+        arms = self.arm_index(actions)
+        x = np.ones(self.dim)
+        for i in range(len(states)):
+            self.update(self.context(states[i], x), arms[i], rewards[i])
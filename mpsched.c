@@ -1,5 +1,99 @@
 #include <python3.7/Python.h>
+#include <arpa/inet.h>
 #include <linux/tcp.h>
+#include <linux/version.h>
+#include <stddef.h>
+#include <string.h>
+
+/*
+  一次最多读取的子流数，运行时可以用 set_max_subflows 修改，不需要重新编译。
+  旧的 NUM_SUBFLOWS 宏仍然可以作为初始值。
+*/
+#ifndef MAX_SUBFLOWS
+#ifdef NUM_SUBFLOWS
+#define MAX_SUBFLOWS NUM_SUBFLOWS
+#else
+#define MAX_SUBFLOWS 8
+#endif
+#endif
+
+#define SUBFLOW_LIMIT 255   // set_seg 的每个子流段数是 unsigned char
+
+static int max_subflows = MAX_SUBFLOWS;
+
+/*
+  对fd调用一次getsockopt，子流数组在堆上按 max_subflows 分配
+
+  已建立的子流被依次移到数组前面，返回其个数，*subflows 由调用者用 PyMem_Free 释放；出错返回-1
+  sub_infos 不为NULL时，各子流的地址（mptcp_sub_info）按同样的顺序放在 *sub_infos，同样由调用者释放
+  slots 不为NULL时（至少 max_subflows 个），slots[n] 是第n行在内核子流数组中的位置，set_seg 按这个位置给段数
+*/
+static int read_mptcp_info(int fd, struct mptcp_meta_info *meta_info, struct tcp_info **subflows,
+                           struct mptcp_sub_info **sub_infos, int *slots)
+{
+  struct mptcp_info minfo;
+  struct tcp_info initial;
+  struct tcp_info *others = PyMem_Calloc(max_subflows, sizeof(struct tcp_info));
+  struct mptcp_sub_info *others_info = PyMem_Calloc(max_subflows, sizeof(struct mptcp_sub_info));
+  if(others == NULL || others_info == NULL) {
+    PyMem_Free(others);
+    PyMem_Free(others_info);
+    PyErr_NoMemory();
+    return -1;
+  }
+  memset(meta_info, 0, sizeof(*meta_info));
+
+  minfo.tcp_info_len = sizeof(struct tcp_info);
+  minfo.sub_len = max_subflows * sizeof(struct tcp_info);
+  minfo.meta_len = sizeof(struct mptcp_meta_info);
+  minfo.meta_info = meta_info;
+  minfo.initial = &initial;
+  minfo.subflows = others;
+  minfo.sub_info_len = sizeof(struct mptcp_sub_info);
+  minfo.total_sub_info_len = max_subflows * sizeof(struct mptcp_sub_info);
+  minfo.subflow_info = others_info;
+
+  socklen_t len = sizeof(minfo);
+  getsockopt(fd, SOL_TCP, MPTCP_INFO, &minfo, &len);
+
+  int i, n = 0;
+  for(i = 0; i < max_subflows; i++) {
+    if(others[i].tcpi_state != 1)   // 1 = TCP_ESTABLISHED，未用到的位置是0
+      continue;
+    if(i != n) {
+      others[n] = others[i];
+      others_info[n] = others_info[i];
+    }
+    if(slots != NULL)
+      slots[n] = i;
+    n++;
+  }
+  *subflows = others;
+  if(sub_infos != NULL)
+    *sub_infos = others_info;
+  else
+    PyMem_Free(others_info);
+  return n;
+}
+
+static PyObject* set_max_subflows(PyObject* self, PyObject* args)
+{
+  int n;
+  if(!PyArg_ParseTuple(args, "i", &n)) {
+    return NULL;
+  }
+  if(n < 1 || n > SUBFLOW_LIMIT) {
+    PyErr_Format(PyExc_ValueError, "max_subflows must be in [1, %d]", SUBFLOW_LIMIT);
+    return NULL;
+  }
+  max_subflows = n;
+  return Py_BuildValue("i", max_subflows);
+}
+
+static PyObject* get_max_subflows(PyObject* self, PyObject* args)
+{
+  return Py_BuildValue("i", max_subflows);
+}
 
 /*
   输入socket的文件描述符fd
@@ -34,25 +128,13 @@ static PyObject* get_meta_info(PyObject* self, PyObject* args)
       return NULL;
     }
 
-    struct mptcp_info minfo;                              // mptcp连接的相关信息
     struct mptcp_meta_info meta_info;                     // mptcp连接实例 的元信息
-    struct tcp_info initial;                              // 单个tcp子连接的信息
-    struct tcp_info others[NUM_SUBFLOWS];                 // 子流对象实例的集合
-    struct mptcp_sub_info others_info[NUM_SUBFLOWS];      // mptcp子流信息
-
-    minfo.tcp_info_len = sizeof(struct tcp_info);
-    minfo.sub_len = sizeof(others);
-    minfo.meta_len = sizeof(struct mptcp_meta_info);
-    minfo.meta_info = &meta_info;
-    minfo.initial = &initial;
-    minfo.subflows = &others;
-    minfo.sub_info_len = sizeof(struct mptcp_sub_info);
-    minfo.total_sub_info_len = sizeof(others_info);
-    minfo.subflow_info = &others_info;
-
-    socklen_t len = sizeof(minfo);
-
-    getsockopt(fd, SOL_TCP, MPTCP_INFO, &minfo, &len);
+    struct tcp_info *others;                              // 子流对象实例的集合
+
+    if(read_mptcp_info(fd, &meta_info, &others, NULL, NULL) < 0)
+      return NULL;
+    PyMem_Free(others);
+
     PyObject *list = PyList_New(0);
     PyList_Append(list, Py_BuildValue("I", meta_info.mptcpi_unacked));
     PyList_Append(list, Py_BuildValue("I", meta_info.mptcpi_retransmits));
@@ -70,24 +152,9 @@ static PyObject* get_sub_info(PyObject* self, PyObject* args)
     return NULL;
   }
 
-// 定义一些结构体
-  struct mptcp_info minfo;
   struct mptcp_meta_info meta_info;
-  struct tcp_info initial;                            // tcp_info是tcp报文中的数据信息
-  struct tcp_info others[NUM_SUBFLOWS];               // NUM_SUBFLOWS表示子流的数量
-  struct mptcp_sub_info others_info[NUM_SUBFLOWS];    // mptcp各个子流中传输的数据报文信息
-
-  minfo.tcp_info_len = sizeof(struct tcp_info);       // tcp报文数据信息结构体大小
-  minfo.sub_len = sizeof(others);                     // 这个tcp连接子流的数量
-  minfo.meta_len = sizeof(struct mptcp_meta_info);    // mptcp结构体元数据长度
-  minfo.meta_info = &meta_info;                       // mptcp_info 对象中包含其自身元数据对象
-  minfo.initial = &initial;                           // 数据信息
-  minfo.subflows = &others;                           // 子流
-  minfo.sub_info_len = sizeof(struct mptcp_sub_info); // 子流数据信息结构体大小
-  minfo.total_sub_info_len = sizeof(others_info);     // 子流个数
-  minfo.subflow_info = &others_info;                  // 子流传输的报文信息
-
-  socklen_t len = sizeof(minfo);      // minfo实例的长度，使用socklen_t来标识，同int
+  struct tcp_info *others;                            // 已建立的子流，个数由返回值给出，上限 max_subflows
+
 /*
 功能：获取一个套接字的选项
  参数：
@@ -110,15 +177,15 @@ static PyObject* get_sub_info(PyObject* self, PyObject* args)
     成功：0
     失败：-1
 */
-  getsockopt(fd, SOL_TCP, MPTCP_INFO, &minfo, &len);
+  int num_subflows = read_mptcp_info(fd, &meta_info, &others, NULL, NULL);
+  if(num_subflows < 0)
+    return NULL;
 
   PyObject *list = PyList_New(0);
   int i;
-  for(i=0; i < NUM_SUBFLOWS; i++){
+  for(i=0; i < num_subflows; i++){
     // 迭代所有的子流
-    if(others[i].tcpi_state != 1)
-      break;
-    
+
     // 使用subflows保存各个子流的tcpi_segs_out，tcpi_rtt，tcpi_snd_cwnd
     PyObject *subflows = PyList_New(0);
     PyList_Append(subflows, Py_BuildValue("I", others[i].tcpi_segs_out));
@@ -129,10 +196,210 @@ static PyObject* get_sub_info(PyObject* self, PyObject* args)
 
     PyList_Append(list, subflows);
   }
+  PyMem_Free(others);
   return list;
 }
 
 
+/*
+  可按名称读取的字段表
+
+  get_info 通过字段名在表中查找偏移量和长度，从同一次 getsockopt 的结果中取值
+  source 是 FROM_SUB_INFO 的字段是 mptcp_sub_info 里网络字节序的端口，用来区分子流；
+  FROM_SLOT 的 "slot" 是该子流在内核子流数组中的位置，set_seg 的段数按它排列
+*/
+enum field_source { FROM_INFO, FROM_SUB_INFO, FROM_SLOT };
+
+struct field_spec {
+  const char *name;
+  size_t offset;
+  size_t size;
+  enum field_source source;
+};
+
+#define FIELD(type, member) {#member, offsetof(struct type, member), sizeof(((struct type *)0)->member), FROM_INFO}
+#define PORT(name, member) {name, offsetof(struct mptcp_sub_info, member), 2, FROM_SUB_INFO}
+
+#ifndef HAVE_TCPI_MIN_RTT
+#define HAVE_TCPI_MIN_RTT (LINUX_VERSION_CODE >= KERNEL_VERSION(4, 6, 0))
+#endif
+#ifndef HAVE_TCPI_DELIVERY_RATE
+#define HAVE_TCPI_DELIVERY_RATE (LINUX_VERSION_CODE >= KERNEL_VERSION(4, 9, 0))
+#endif
+
+static const struct field_spec tcp_fields[] = {
+  FIELD(tcp_info, tcpi_state),
+  FIELD(tcp_info, tcpi_ca_state),
+  FIELD(tcp_info, tcpi_retransmits),
+  FIELD(tcp_info, tcpi_probes),
+  FIELD(tcp_info, tcpi_backoff),
+  FIELD(tcp_info, tcpi_rto),
+  FIELD(tcp_info, tcpi_snd_mss),
+  FIELD(tcp_info, tcpi_unacked),
+  FIELD(tcp_info, tcpi_sacked),
+  FIELD(tcp_info, tcpi_lost),
+  FIELD(tcp_info, tcpi_retrans),
+  FIELD(tcp_info, tcpi_last_data_sent),
+  FIELD(tcp_info, tcpi_last_ack_recv),
+  FIELD(tcp_info, tcpi_rtt),
+  FIELD(tcp_info, tcpi_rttvar),
+  FIELD(tcp_info, tcpi_snd_ssthresh),
+  FIELD(tcp_info, tcpi_snd_cwnd),
+  FIELD(tcp_info, tcpi_reordering),
+  FIELD(tcp_info, tcpi_total_retrans),
+  FIELD(tcp_info, tcpi_pacing_rate),
+  FIELD(tcp_info, tcpi_max_pacing_rate),
+  FIELD(tcp_info, tcpi_bytes_acked),
+  FIELD(tcp_info, tcpi_bytes_received),
+  FIELD(tcp_info, tcpi_segs_out),
+  FIELD(tcp_info, tcpi_segs_in),
+#if HAVE_TCPI_MIN_RTT
+  FIELD(tcp_info, tcpi_notsent_bytes),
+  FIELD(tcp_info, tcpi_min_rtt),
+  FIELD(tcp_info, tcpi_data_segs_out),
+#endif
+#if HAVE_TCPI_DELIVERY_RATE
+  FIELD(tcp_info, tcpi_delivery_rate),
+#endif
+  PORT("src_port", src_v4.sin_port),   // sin6_port 与 sin_port 偏移相同
+  PORT("dst_port", dst_v4.sin_port),
+  {"slot", 0, 0, FROM_SLOT},
+  {NULL, 0, 0, 0}
+};
+
+static const struct field_spec meta_fields[] = {
+  FIELD(mptcp_meta_info, mptcpi_state),
+  FIELD(mptcp_meta_info, mptcpi_retransmits),
+  FIELD(mptcp_meta_info, mptcpi_rto),
+  FIELD(mptcp_meta_info, mptcpi_unacked),
+  FIELD(mptcp_meta_info, mptcpi_last_data_sent),
+  FIELD(mptcp_meta_info, mptcpi_last_ack_recv),
+  FIELD(mptcp_meta_info, mptcpi_total_retrans),
+  FIELD(mptcp_meta_info, mptcpi_bytes_acked),
+  FIELD(mptcp_meta_info, mptcpi_bytes_received),
+  {NULL, 0, 0, 0}
+};
+
+#define MAX_FIELDS 32
+
+/*
+  把字段名序列解析成字段表中的下标，返回字段个数，出错返回-1
+*/
+static int resolve_fields(PyObject *names, const struct field_spec *table, const struct field_spec **out)
+{
+  PyObject *seq = PySequence_Fast(names, "fields must be a sequence of field names");
+  if(seq == NULL)
+    return -1;
+
+  Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+  if(n > MAX_FIELDS) {
+    PyErr_Format(PyExc_ValueError, "at most %d fields can be requested", MAX_FIELDS);
+    Py_DECREF(seq);
+    return -1;
+  }
+
+  Py_ssize_t i;
+  for(i = 0; i < n; i++) {
+    const char *name = PyUnicode_AsUTF8(PySequence_Fast_GET_ITEM(seq, i));
+    if(name == NULL) {
+      Py_DECREF(seq);
+      return -1;
+    }
+    const struct field_spec *spec;
+    for(spec = table; spec->name != NULL; spec++) {
+      if(strcmp(spec->name, name) == 0)
+        break;
+    }
+    if(spec->name == NULL) {
+      PyErr_Format(PyExc_ValueError, "unknown field: %s", name);
+      Py_DECREF(seq);
+      return -1;
+    }
+    out[i] = spec;
+  }
+  Py_DECREF(seq);
+  return (int)n;
+}
+
+static PyObject* read_field(const void *base, const struct field_spec *spec)
+{
+  const char *p = (const char *)base + spec->offset;
+  if(spec->source == FROM_SUB_INFO)
+    return PyLong_FromUnsignedLong(ntohs(*(const __u16 *)p));
+  switch(spec->size) {
+    case 1:
+      return PyLong_FromUnsignedLong(*(const __u8 *)p);
+    case 2:
+      return PyLong_FromUnsignedLong(*(const __u16 *)p);
+    case 4:
+      return PyLong_FromUnsignedLong(*(const __u32 *)p);
+    default:
+      return PyLong_FromUnsignedLongLong(*(const __u64 *)p);
+  }
+}
+
+/*
+  输入socket的文件描述符fd、子流字段名列表、元信息字段名列表
+
+  只调用一次getsockopt，返回 (各子流的字段值列表, 元信息字段值列表)
+*/
+static PyObject* get_info(PyObject* self, PyObject* args)
+{
+  int fd;
+  PyObject *sub_names;
+  PyObject *meta_names;
+  if(!PyArg_ParseTuple(args, "iOO", &fd, &sub_names, &meta_names)) {
+    return NULL;
+  }
+
+  const struct field_spec *sub_specs[MAX_FIELDS];
+  const struct field_spec *meta_specs[MAX_FIELDS];
+  int num_sub = resolve_fields(sub_names, tcp_fields, sub_specs);
+  if(num_sub < 0)
+    return NULL;
+  int num_meta = resolve_fields(meta_names, meta_fields, meta_specs);
+  if(num_meta < 0)
+    return NULL;
+
+  struct mptcp_meta_info meta_info;
+  struct tcp_info *others;
+  struct mptcp_sub_info *others_info;
+  int *slots = PyMem_Calloc(max_subflows, sizeof(int));
+  if(slots == NULL)
+    return PyErr_NoMemory();
+  int num_subflows = read_mptcp_info(fd, &meta_info, &others, &others_info, slots);
+  if(num_subflows < 0) {
+    PyMem_Free(slots);
+    return NULL;
+  }
+
+  PyObject *list = PyList_New(0);
+  int i, j;
+  for(i=0; i < num_subflows; i++){
+    PyObject *subflow = PyList_New(num_sub);
+    for(j=0; j < num_sub; j++) {
+      if(sub_specs[j]->source == FROM_SLOT) {
+        PyList_SET_ITEM(subflow, j, PyLong_FromLong(slots[i]));
+        continue;
+      }
+      const void *base = sub_specs[j]->source == FROM_SUB_INFO ? (const void *)&others_info[i]
+                                                                : (const void *)&others[i];
+      PyList_SET_ITEM(subflow, j, read_field(base, sub_specs[j]));
+    }
+    PyList_Append(list, subflow);
+    Py_DECREF(subflow);
+  }
+  PyMem_Free(others);
+  PyMem_Free(others_info);
+  PyMem_Free(slots);
+
+  PyObject *meta = PyList_New(num_meta);
+  for(j=0; j < num_meta; j++)
+    PyList_SET_ITEM(meta, j, read_field(&meta_info, meta_specs[j]));
+
+  return Py_BuildValue("(NN)", list, meta);
+}
+
 static PyObject* set_seg(PyObject* self, PyObject* args)
 {
   PyObject * listObj;
@@ -140,16 +407,25 @@ static PyObject* set_seg(PyObject* self, PyObject* args)
     return NULL;
 
   long length = PyList_Size(listObj);
+  if(length < 2 || length - 1 > max_subflows) {
+    PyErr_Format(PyExc_ValueError, "set_seg expects [fd, seg_1, ..., seg_n] with 1 <= n <= %d", max_subflows);
+    return NULL;
+  }
   int fd = (int)PyLong_AsLong(PyList_GetItem(listObj, 0));
   int i;
 
   struct mptcp_sched_info sched_info;
   sched_info.len = length-1;
-  unsigned char quota[NUM_SUBFLOWS];
-  unsigned char segments[NUM_SUBFLOWS];
+  unsigned char *quota = PyMem_Calloc(length - 1, 1);
+  unsigned char *segments = PyMem_Calloc(length - 1, 1);
+  if(quota == NULL || segments == NULL) {
+    PyMem_Free(quota);
+    PyMem_Free(segments);
+    return PyErr_NoMemory();
+  }
 
-  sched_info.quota = &quota;
-  sched_info.num_segments = &segments;
+  sched_info.quota = quota;
+  sched_info.num_segments = segments;
 
   for(i=1; i<length; i++) {
     PyObject* temp = PyList_GetItem(listObj, i);
@@ -159,6 +435,8 @@ static PyObject* set_seg(PyObject* self, PyObject* args)
   }
 
   setsockopt(fd, SOL_TCP, MPTCP_SCHED_INFO, &sched_info, sizeof(sched_info));
+  PyMem_Free(quota);
+  PyMem_Free(segments);
 
   return Py_BuildValue("i", fd);
 }
@@ -167,7 +445,10 @@ static PyMethodDef Methods[] = {
   {"persist_state", persist_state, METH_VARARGS, "persist mptcp subflows tate"},
   {"get_meta_info", get_meta_info, METH_VARARGS, "get mptcp recv buff size"},
   {"get_sub_info", get_sub_info, METH_VARARGS, "get mptcp subflows info"},
+  {"get_info", get_info, METH_VARARGS, "get chosen subflow and meta fields with one getsockopt"},
   {"set_seg", set_seg, METH_VARARGS, "set num of segments in all mptcp subflows"},
+  {"set_max_subflows", set_max_subflows, METH_VARARGS, "set the max number of subflows read per call"},
+  {"get_max_subflows", get_max_subflows, METH_NOARGS, "get the max number of subflows read per call"},
   {NULL, NULL, 0, NULL}
 };
 
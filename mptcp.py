@@ -0,0 +1,210 @@
+"""
+MPTCP 实验的统一入口
+
+    python mptcp.py send [--engine sendfile|mmap|loop|all]
+    python mptcp.py receive [--asyncio] [--mode splice]
+    python mptcp.py train [train_2.py 的参数 ...]
+    python mptcp.py evaluate --policy policy.npz [--sim] [--episodes 1]
+    python mptcp.py benchmark {startup,recv,inference,numpy_policy,target_update}
+
+每个子命令只在运行时导入自己需要的模块：send / receive / evaluate 不导入
+torch 和 gym，只有 train 和相关的 benchmark 才会导入。
+"""
+import argparse
+import os
+import sys
+import time
+from configparser import ConfigParser
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ('torch', 'gym')
+
+
+def load_config(path=None):
+    cfg = ConfigParser()
+    cfg.read(path or 'config.ini')
+    return cfg
+
+
+def cmd_send(args, rest):
+    from sender import ENGINES, engine_config, completion_time
+
+    cfg = load_config(args.config)
+    ip = cfg.get('server', 'ip')
+    port = cfg.getint('server', 'port')
+    filename = args.file or cfg.get('file', 'file')
+    engines = ENGINES if args.engine == 'all' else (args.engine,)
+    for engine in engines:
+        engine, chunk_size = engine_config(cfg, engine)
+        t = completion_time(ip, port, filename, engine, chunk_size)
+        print("engine: {}, chunk: {}, completion time: {}".format(engine, chunk_size, t))
+
+
+def cmd_receive(args, rest):
+    sys.path.insert(0, os.path.join(HERE, 'mptcp_recv'))
+    import recv
+
+    recv.main(rest)
+
+
+def cmd_train(args, rest):
+    import train_2
+
+    train_2.main(rest, config=args.config or 'config.ini')
+
+
+def cmd_evaluate(args, rest):
+    """ run an exported policy (numpy_policy.export_npz) without torch """
+    from numpy_policy import NumpyPolicy
+
+    cfg = load_config(args.config)
+    t = cfg.getfloat('env', 'time')
+    policy = NumpyPolicy(args.policy)
+    max_subflows = policy.subflows if policy.mask else None  # 与训练时相同的补齐行数
+    for episode in range(args.episodes):
+        sock = io = None
+        if args.sim:
+            from simulator import SimEnv
+            my_env = SimEnv(time=t, k=8, l=0.01, n=0.03, p=0.05, max_subflows=max_subflows)
+        else:
+            import socket
+            import mpsched
+            from sender import engine_config
+            from mptcp_env import env, io_thread
+
+            engine, chunk_size = engine_config(cfg)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect((cfg.get('server', 'ip'), cfg.getint('server', 'port')))
+            fd = sock.fileno()
+            my_env = env(fd=fd, buff_size=cfg.getint('env', 'buffer_size'), time=t, k=8, l=0.01, n=0.03, p=0.05,
+                         max_subflows=max_subflows)
+            mpsched.persist_state(fd)
+            io = io_thread(sock=sock, filename=args.file or cfg.get('file', 'file'),
+                           buffer_size=chunk_size, engine=engine)
+            io.start()
+
+        obs = my_env.reset()
+        episode_reward = 0
+        start_time = time.time()
+        while True:
+            action = policy.select_action(obs)
+            obs, reward, count, recv_buff_size, done = my_env.step(action)
+            episode_reward += reward
+            if done:
+                break
+        if io is not None:
+            io.join()
+        print("Episode: {}, reward: {}, steps: {}, completion time: {}".format(
+            episode, episode_reward, count, time.time() - start_time))
+
+
+# modules each subcommand imports when it runs
+COMMAND_MODULES = {
+    'send': ('sender',),
+    'receive': ('receiver', 'recv'),
+    'evaluate': ('numpy_policy', 'simulator', 'mptcp_env'),
+    'train': ('train_2',),
+}
+
+
+def benchmark_startup(repeat=3):
+    """ time to import what each subcommand needs, in a fresh interpreter, and
+        whether torch / gym came with it """
+    import subprocess
+
+    probe = ("import sys, time\n"
+             "start = time.perf_counter()\n"
+             "sys.path[:0] = [{here!r}, {recv!r}]\n"
+             "import mptcp\n"
+             "for m in {mods!r}:\n"
+             "    __import__(m)\n"
+             "print(time.perf_counter() - start)\n"
+             "print(' '.join(m for m in {heavy!r} if m in sys.modules) or '-')\n")
+    print("{:>10} {:>9} {:>9}  {}".format('command', 'import', 'process', 'torch/gym loaded'))
+    for cmd, mods in sorted(COMMAND_MODULES.items()):
+        code = probe.format(here=HERE, recv=os.path.join(HERE, 'mptcp_recv'), mods=mods, heavy=HEAVY_MODULES)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            p = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=HERE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            elapsed = time.perf_counter() - start
+            if p.returncode != 0:
+                break
+            out = p.stdout.decode().split()
+            if best is None or elapsed < best[1]:
+                best = (float(out[0]), elapsed, ' '.join(out[1:]))
+        if best is None:
+            error = p.stderr.decode().strip().splitlines()
+            print("{:>10}  failed: {}".format(cmd, error[-1] if error else p.returncode))
+        else:
+            print("{:>10} {:8.3f}s {:8.3f}s  {}".format(cmd, best[0], best[1], best[2]))
+
+
+def cmd_benchmark(args, rest):
+    if args.target == 'startup':
+        benchmark_startup()
+    elif args.target == 'recv':
+        sys.path.insert(0, os.path.join(HERE, 'mptcp_recv'))
+        from receiver import benchmark
+        benchmark()
+    elif args.target == 'inference':
+        from inference import benchmark
+        benchmark()
+    elif args.target == 'numpy_policy':
+        from numpy_policy import benchmark
+        benchmark()
+    elif args.target == 'target_update':
+        from target_update import benchmark
+        benchmark()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='MPTCP scheduling experiments')
+    parser.add_argument('--config', default=None,
+                        help='config file of send, train and evaluate (default: config.ini)')
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('send', help='send one file and print the completion time')
+    p.add_argument('--engine', default=None, choices=('sendfile', 'mmap', 'loop', 'all'),
+                   help='send engine, "all" compares every engine (default: config.ini)')
+    p.add_argument('--file', default=None, help='file to send (default: config.ini)')
+    p.set_defaults(func=cmd_send)
+
+    p = sub.add_parser('receive', help='run the receiver, other arguments go to mptcp_recv/recv.py',
+                       add_help=False)
+    p.set_defaults(func=cmd_receive)
+
+    p = sub.add_parser('train', help='train an agent, other arguments go to train_2.py', add_help=False)
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser('evaluate', help='run an exported .npz policy without torch')
+    p.add_argument('--policy', required=True, help='file written by train --export')
+    p.add_argument('--sim', action='store_true', help='use the simulated paths of simulator.py')
+    p.add_argument('--episodes', type=int, default=1)
+    p.add_argument('--file', default=None, help='file to send (default: config.ini)')
+    p.set_defaults(func=cmd_evaluate)
+
+    p = sub.add_parser('benchmark', help='run one of the micro benchmarks')
+    p.add_argument('target', choices=('startup', 'recv', 'inference', 'numpy_policy', 'target_update'))
+    p.set_defaults(func=cmd_benchmark)
+    return parser
+
+
+def main(argv=None):
+    sys.path.insert(0, HERE)
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return
+    if rest and args.command not in ('receive', 'train'):
+        parser.error("unrecognized arguments: {}".format(' '.join(rest)))
+    if args.config is not None and args.command in ('receive', 'benchmark'):
+        parser.error("{} does not read a config file, --config cannot be used with it".format(args.command))
+    args.func(args, rest)
+
+
+if __name__ == '__main__':
+    main()
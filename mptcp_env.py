@@ -0,0 +1,351 @@
+import socket
+import threading
+import time
+
+import numpy as np
+
+import mpsched
+from sender import send_file
+from obs_window import ObservationWindow
+from ticker import Ticker
+
+
+class io_thread(threading.Thread):
+
+    def __init__(self, sock, filename, buffer_size, engine='loop'):
+        threading.Thread.__init__(self)
+        self.sock = sock
+        self.buffer_size = buffer_size
+        self.filename = filename
+        self.engine = engine
+
+    def run(self):
+        fp = open(self.filename, 'rb')
+        self.sock.send(bytes(self.filename, encoding='utf8'))
+        buff = self.sock.recv(16)
+        print(str(buff, encoding='utf8'))
+
+        send_file(self.sock, fp, self.engine, self.buffer_size)
+        self.sock.close()
+        fp.close()
+
+
+SUB_FIELDS = ('tcpi_segs_out', 'tcpi_rtt', 'tcpi_snd_cwnd')  # 前三项依次是env使用的发送段数、RTT、拥塞窗口
+META_FIELDS = ('mptcpi_unacked', 'mptcpi_retransmits')
+SUB_KEY_FIELDS = ('src_port', 'dst_port')  # 区分子流的端口，总是附加在读取字段的最后
+SLOT_FIELD = 'slot'  # 子流在内核子流数组中的位置，set_seg 的段数按它排列
+
+
+def with_key_fields(sub_fields):
+    return tuple(sub_fields) + tuple(f for f in SUB_KEY_FIELDS + (SLOT_FIELD,) if f not in sub_fields)
+
+
+def segs_out_deltas(subs, n, last, keys, key_index, out):
+    """ out[j] = segs_out of row j since the previous tick, n <= len(last).
+
+    get_info compacts the established subflows, so a row can hold another
+    subflow than on the previous tick: rows are matched to the previous
+    tick by their ports, a subflow not seen before starts from its current
+    segs_out (delta 0). last and keys are updated in place, rows past n
+    are cleared.
+    """
+    prev = {key: value for key, value in zip(keys, last) if key is not None}
+    for j in range(n):
+        key = tuple(subs[j][f] for f in key_index)
+        out[j] = subs[j][0] - prev.get(key, subs[j][0])
+        last[j] = subs[j][0]
+        keys[j] = key
+    last[n:] = 0
+    for j in range(n, len(keys)):
+        keys[j] = None
+
+
+def set_max_subflows(max_subflows):
+    """ let mpsched report up to max_subflows subflows; None keeps the built-in limit """
+    if max_subflows is not None:
+        mpsched.set_max_subflows(max_subflows)
+
+
+class env():
+    """ max_subflows pads the observation to that many rows with an active column """
+    def __init__(self, fd, buff_size, time, k, l, n, p, subflows=2, sub_fields=SUB_FIELDS, meta_fields=META_FIELDS,
+                 max_subflows=None):
+        self.fd = fd
+        self.sub_fields = with_key_fields(sub_fields)  ##每个时间片从子流读取的字段
+        self.key_index = [self.sub_fields.index(f) for f in SUB_KEY_FIELDS]
+        self.meta_fields = tuple(meta_fields)
+        self.buff_size = buff_size
+        self.k = k  ##对以往k个时间段的观测
+        self.l = l  ##吞吐量的奖励因子
+        #self.m = m  ##RTT惩罚因子
+        self.n = n  ##缓冲区膨胀惩罚因子
+        self.p = p  ##重传惩罚因子
+        self.time = time
+        self.mask = max_subflows is not None  ##观测补齐到max_subflows行，最后一列标记真实子流
+        subflows = max_subflows or subflows
+        set_max_subflows(max_subflows)
+        self.subflows = subflows
+        self.window = ObservationWindow(subflows, k, features=3, extra=2, mask=self.mask)  ##吞吐量、RTT、拥塞窗口的k个时间片
+        self.last = np.zeros(subflows)
+        self.keys = [None] * subflows  ##每行上一个时间片的子流端口
+        self.sample = np.zeros((subflows, 3))
+        self.rr = 0
+        self.count = 1
+        self.recv_buff_size = 0
+        self.sub_info = []  ##最近一次读取的全部子流字段
+        self.ticker = Ticker(time)  ##按截止时间对齐的时间片
+        self.timestamp = 0  ##最近一次采样的单调时钟时间
+        self.elapsed = time  ##最近一个时间片的实际长度
+        
+        self._observation_space = None
+        self._action_space = None
+
+    """ gym spaces are built on first use, so acting without gym never imports it """
+    @property
+    def observation_space(self):
+        if self._observation_space is None:
+            from gym import spaces
+            num_inputs = self.window.obs.shape[-1]
+            self._observation_space = spaces.Box(np.zeros(num_inputs), np.full(num_inputs, float("inf")))
+        return self._observation_space
+
+    @property
+    def action_space(self):
+        if self._action_space is None:
+            from gym import spaces
+            self._action_space = spaces.Box(np.array([1]), np.array([4]))
+        return self._action_space
+
+    
+    """ adjust info to get goodput """
+    def adjust(self, state, mate):
+        self.sub_info = state
+        self.push(state, self.elapsed)
+        self.recv_buff_size = mate[0]
+        self.rr = mate[1] - self.rr
+        return self.window.observation((self.recv_buff_size, self.rr))
+
+    """ write one tick of [segs_out, rtt, cwnd] per subflow into the window,
+        the segs_out delta is scaled from the elapsed time to one nominal tick """
+    def push(self, subs, elapsed):
+        n = min(len(subs), self.subflows)
+        scale = self.time / elapsed if elapsed > 0 else 1.0
+        segs_out_deltas(subs, n, self.last, self.keys, self.key_index, self.sample[:, 0])
+        self.sample[:n, 0] *= scale
+        for j in range(n):
+            self.sample[j, 1] = subs[j][1]
+            self.sample[j, 2] = subs[j][2]
+        self.window.push(self.sample[:n])
+
+    def reward(self):
+        rewards = self.l * float(self.window.series(0).sum())
+        #rewards = rewards - self.m * float(self.window.series(1).sum())
+        rewards = rewards + self.n * self.recv_buff_size
+        rewards = rewards - self.p * self.rr
+        return rewards
+
+    """ reset env, return the initial state  """
+    def reset(self):
+        mpsched.persist_state(self.fd)
+        time.sleep(1)
+        self.window.reset()
+        self.keys = [None] * self.subflows
+        subs, _ = mpsched.get_info(self.fd, self.sub_fields, self.meta_fields)
+        segs_out_deltas(subs, min(len(subs), self.subflows), self.last, self.keys, self.key_index, self.sample[:, 0])
+        self.ticker.reset()
+
+        for i in range(self.k):
+            self.timestamp, self.elapsed = self.ticker.wait()
+            self.sub_info, mate = mpsched.get_info(self.fd, self.sub_fields, self.meta_fields)
+            self.push(self.sub_info, self.elapsed)
+        self.recv_buff_size = mate[0]
+        self.rr = mate[1]
+        return self.window.observation((self.recv_buff_size, self.rr))
+
+    """ action = [sub1_buff_size, sub2_buff_size] """
+    def step(self, action):
+        # A = [self.fd, action[0], action[1]]
+        # mpsched.set_seg(A)
+        self.timestamp, self.elapsed = self.ticker.wait()
+        state_nxt, mate = mpsched.get_info(self.fd, self.sub_fields, self.meta_fields)
+        done = False
+        if len(state_nxt) == 0:
+            done = True
+        self.count = self.count + 1
+        return self.adjust(state_nxt, mate), self.reward(), self.count, self.recv_buff_size, done
+
+
+class VecEnv(object):
+    """ num_envs MPTCP connections sampled on one shared tick.
+
+    reset() opens num_envs connections to addr, each with its own io_thread
+    sending filename, and fills a batched ObservationWindow from k ticks.
+    step(actions) optionally applies the (num_envs, subflows, 1) segment
+    counts with mpsched.set_seg, waits for the next tick of the single
+    Ticker, reads every live connection with one get_info each and returns
+    stacked results, with the same interface as simulator.MPTCPSim:
+    (obs (num_envs, subflows, features), reward (num_envs,), count,
+    unacked (num_envs,), done (num_envs,)). A connection whose transfer
+    has ended stays done and is no longer read; its throughput samples
+    are zero until every connection is done. Retransmits are counted per
+    tick, as in MPTCPSim. With max_subflows every connection is padded to
+    that many rows and the last column marks the established subflows.
+    get_info compacts the established subflows, so set_seg gets the count
+    of each row at the kernel slot the row was read from, and 0 for the
+    slots in between.
+    """
+
+    def __init__(self, addr, num_envs, filename, time, k, l, n, p, subflows=2, engine='loop',
+                 chunk_size=1024, sub_fields=SUB_FIELDS, meta_fields=META_FIELDS, set_seg=False,
+                 max_subflows=None):
+        self.addr = addr
+        self.num_envs = num_envs
+        self.filename = filename
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.sub_fields = with_key_fields(sub_fields)
+        self.key_index = [self.sub_fields.index(f) for f in SUB_KEY_FIELDS]
+        self.slot_index = self.sub_fields.index(SLOT_FIELD)
+        self.meta_fields = tuple(meta_fields)
+        self.time = time
+        self.k = k
+        self.l = l
+        self.n = n
+        self.p = p
+        self.mask = max_subflows is not None
+        subflows = max_subflows or subflows
+        set_max_subflows(max_subflows)
+        self.subflows = subflows
+        self.set_seg = set_seg
+
+        self.window = ObservationWindow(subflows, k, features=3, extra=2, batch=num_envs, mask=self.mask)
+        self.sample = np.zeros((num_envs, subflows, 3))
+        self.live = np.zeros((num_envs, subflows), dtype=bool)  ##每个连接当前已建立的子流
+        self.slots = np.zeros((num_envs, subflows), dtype=int)  ##每行子流在内核子流数组中的位置
+        self.extra = np.zeros((num_envs, 1, 2))
+        self.last = np.zeros((num_envs, subflows))
+        self.keys = [[None] * subflows for _ in range(num_envs)]
+        self.last_retrans = np.zeros(num_envs)
+        self.done = np.zeros(num_envs, dtype=bool)
+        self.ticker = Ticker(time)
+        self.timestamp = 0
+        self.elapsed = time
+        self.count = 1
+        self.socks = []
+        self.fds = []
+        self.io = []
+        self._observation_space = None
+        self._action_space = None
+
+    @property
+    def observation_space(self):
+        if self._observation_space is None:
+            from gym import spaces
+            num_inputs = self.window.obs.shape[-1]
+            self._observation_space = spaces.Box(np.zeros(num_inputs), np.full(num_inputs, float("inf")))
+        return self._observation_space
+
+    @property
+    def action_space(self):
+        if self._action_space is None:
+            from gym import spaces
+            self._action_space = spaces.Box(np.array([1]), np.array([4]))
+        return self._action_space
+
+    def open(self):
+        self.close()
+        for i in range(self.num_envs):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect(self.addr)
+            fd = sock.fileno()
+            mpsched.persist_state(fd)
+            io = io_thread(sock=sock, filename=self.filename, buffer_size=self.chunk_size, engine=self.engine)
+            io.start()
+            self.socks.append(sock)
+            self.fds.append(fd)
+            self.io.append(io)
+
+    def close(self):
+        """ wait for every sender, the io threads close their sockets """
+        for io in self.io:
+            io.join()
+        self.socks = []
+        self.fds = []
+        self.io = []
+
+    def _sample(self):
+        self.timestamp, self.elapsed = self.ticker.wait()
+        scale = self.time / self.elapsed if self.elapsed > 0 else 1.0
+        for i, fd in enumerate(self.fds):
+            if self.done[i]:
+                self.sample[i, :, 0] = 0
+                self.live[i] = False
+                continue
+            subs, mate = mpsched.get_info(fd, self.sub_fields, self.meta_fields)
+            if len(subs) == 0:
+                self.done[i] = True
+                self.sample[i, :, 0] = 0
+                self.live[i] = False
+                continue
+            m = min(len(subs), self.subflows)
+            segs_out_deltas(subs, m, self.last[i], self.keys[i], self.key_index, self.sample[i, :, 0])
+            self.sample[i, :m, 0] *= scale
+            for j in range(m):
+                self.sample[i, j, 1] = subs[j][1]
+                self.sample[i, j, 2] = subs[j][2]
+                self.slots[i, j] = subs[j][self.slot_index]
+            self.live[i, :m] = True
+            self.live[i, m:] = False
+            if self.mask:
+                self.sample[i, m:] = 0
+            self.extra[i, 0, 0] = mate[0]
+            self.extra[i, 0, 1] = mate[1] - self.last_retrans[i]
+            self.last_retrans[i] = mate[1]
+        self.window.push(self.sample, self.live)
+
+    def reward(self):
+        rewards = self.l * self.window.series(0).sum(axis=(1, 2))
+        rewards = rewards + self.n * self.extra[:, 0, 0]
+        rewards = rewards - self.p * self.extra[:, 0, 1]
+        return rewards
+
+    def reset(self):
+        self.open()
+        time.sleep(1)
+        self.window.reset()
+        self.sample.fill(0)
+        self.extra.fill(0)
+        self.last.fill(0)
+        self.keys = [[None] * self.subflows for _ in range(self.num_envs)]
+        self.last_retrans.fill(0)
+        self.live.fill(False)
+        self.done.fill(False)
+        self.count = 1
+        for i, fd in enumerate(self.fds):
+            subs, mate = mpsched.get_info(fd, self.sub_fields, self.meta_fields)
+            segs_out_deltas(subs, min(len(subs), self.subflows), self.last[i], self.keys[i], self.key_index,
+                            self.sample[i, :, 0])
+            if len(mate):
+                self.last_retrans[i] = mate[1]
+        self.ticker.reset()
+        for i in range(self.k):
+            self._sample()
+        return self.window.observation(self.extra)
+
+    def set_actions(self, actions):
+        segs = np.rint(np.asarray(actions, dtype=np.float64).reshape(self.num_envs, self.subflows)).astype(int)
+        for i, fd in enumerate(self.fds):
+            if not self.done[i]:
+                m = int(self.live[i].sum())
+                if m > 0:
+                    quota = np.zeros(self.slots[i, :m].max() + 1, dtype=int)  # 中间未建立的位置给0
+                    quota[self.slots[i, :m]] = segs[i, :m]
+                    mpsched.set_seg([fd] + [int(s) for s in quota])
+
+    def step(self, actions):
+        if self.set_seg and actions is not None:
+            self.set_actions(actions)
+        self._sample()
+        self.count = self.count + 1
+        obs = self.window.observation(self.extra)
+        return obs, self.reward(), self.count, self.extra[:, 0, 0], self.done.copy()
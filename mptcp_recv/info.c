@@ -42,8 +42,8 @@ static PyObject* get_info(PyObject* self, PyObject* args)
   PyObject *list = PyList_New(0);
   if(others[0].tcpi_state == 1)
   {
-      PyList_Append(list, Py_BuildValue("I", others[0].tcpi_bytes_received));
-      PyList_Append(list, Py_BuildValue("I", others[1].tcpi_bytes_received));
+      PyList_Append(list, Py_BuildValue("K", (unsigned long long)others[0].tcpi_bytes_received));
+      PyList_Append(list, Py_BuildValue("K", (unsigned long long)others[1].tcpi_bytes_received));
       PyList_Append(list, Py_BuildValue("I", meta_info.mptcpi_recv_ofo_buff));
   }
   return list;
@@ -0,0 +1,131 @@
+import fcntl
+import os
+import socket
+import threading
+import time
+
+
+MODES = ('splice', 'recv_into', 'recv')
+
+F_SETPIPE_SZ = 1031
+
+
+def recv_loop(sock, fp, chunk_size):
+    """ recv + write, one bytes object per chunk (original behaviour) """
+    while True:
+        buff = sock.recv(chunk_size)
+        if not buff:
+            break
+        if fp is not None:
+            fp.write(buff)
+
+
+def recv_into_loop(sock, fp, chunk_size, buff=None):
+    """ recv_into one preallocated buffer, nothing is allocated per chunk """
+    if buff is None:
+        buff = bytearray(chunk_size)
+    view = memoryview(buff)
+    try:
+        while True:
+            n = sock.recv_into(view)
+            if n == 0:
+                break
+            if fp is not None:
+                fp.write(view[:n])
+    finally:
+        view.release()
+
+
+def recv_splice(sock, fp, chunk_size):
+    """ socket -> pipe -> file with os.splice, the payload never enters userspace """
+    if not hasattr(os, 'splice'):
+        return recv_into_loop(sock, fp, chunk_size)
+    if fp is None:
+        sink = os.open(os.devnull, os.O_WRONLY)
+    else:
+        fp.flush()
+        sink = fp.fileno()
+    r, w = os.pipe()
+    try:
+        try:
+            fcntl.fcntl(w, F_SETPIPE_SZ, chunk_size)
+        except OSError:
+            pass
+        src = sock.fileno()
+        while True:
+            n = os.splice(src, w, chunk_size)
+            if n == 0:
+                break
+            while n > 0:
+                n -= os.splice(r, sink, n)
+    finally:
+        os.close(r)
+        os.close(w)
+        if fp is None:
+            os.close(sink)
+
+
+RECEIVERS = {
+    'splice': recv_splice,
+    'recv_into': recv_into_loop,
+    'recv': recv_loop,
+}
+
+
+def receive_file(sock, fp, mode='recv', chunk_size=2048):
+    """ drain sock into fp until EOF, fp=None discards the data """
+    if mode not in RECEIVERS:
+        raise ValueError("unknown receive mode: {} (choose from {})".format(mode, ', '.join(MODES)))
+    RECEIVERS[mode](sock, fp, chunk_size)
+
+
+def benchmark(total=512 * 2 ** 20, chunk_sizes=(2048, 65536, 1048576), path=None):
+    """ loopback throughput of every mode, to a file (path) or discarded """
+    payload = bytes(1048576)
+
+    def send(port):
+        s = socket.create_connection(('127.0.0.1', port))
+        view = memoryview(payload)
+        left = total
+        while left > 0:
+            n = min(left, len(payload))
+            s.sendall(view[:n])
+            left -= n
+        s.close()
+
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+
+    results = []
+    for chunk_size in chunk_sizes:
+        for mode in MODES:
+            t = threading.Thread(target=send, args=(port,))
+            t.start()
+            c, _ = server.accept()
+            fp = open(path, 'wb') if path is not None else None
+            start = time.perf_counter()
+            receive_file(c, fp, mode, chunk_size)
+            if fp is not None:
+                fp.close()
+            elapsed = time.perf_counter() - start
+            c.close()
+            t.join()
+            results.append((mode, chunk_size, total / elapsed / 2 ** 20))
+            print("{:>10} {:>8} {:10.1f} MB/s".format(mode, chunk_size, results[-1][2]))
+    server.close()
+    if path is not None:
+        os.remove(path)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='receive throughput of every mode')
+    parser.add_argument('--size', type=int, default=512, help='MB per run')
+    parser.add_argument('--file', default=None, help='write to this file instead of discarding')
+    args = parser.parse_args()
+    benchmark(total=args.size * 2 ** 20, path=args.file)
@@ -1,19 +1,31 @@
+import argparse
+import asyncio
+import os
 import socket
+import struct
 import threading
 import info
+from receiver import MODES, receive_file
 import time
 
 
 class recv_thread(threading.Thread):
 
-    def __init__(self, sock, buff_size=2048):
+    def __init__(self, sock, buff_size=2048, mode='recv', discard=False):
         threading.Thread.__init__(self)
         self.sock = sock
         self.buffer_size = buff_size
+        self.mode = mode
+        self.discard = discard
 
     def run(self):
-        buff = self.sock.recv(self.buffer_size)
+        buff = self.sock.recv(2048)
         filename = str(buff, encoding='utf8')
+        if self.discard:
+            self.sock.send(bytes("ok", encoding='utf8'))
+            receive_file(self.sock, None, self.mode, self.buffer_size)
+            print("recieve file {} from sender finished (discarded).".format(filename))
+            return
         fp = open(filename, 'wb')
         if not fp:
             print("open file error.\n")
@@ -21,35 +33,81 @@ class recv_thread(threading.Thread):
             pass
         else:
             self.sock.send(bytes("ok", encoding='utf8'))
-            while(True):
-                buff = self.sock.recv(self.buffer_size)
-                if not buff:
-                    break
-                else:
-                    fp.write(buff)
+            receive_file(self.sock, fp, self.mode, self.buffer_size)
             print("recieve file {} from sender finished.".format(filename))
             fp.close()
 
 
+RECORD_MAGIC = b'MPRC'
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct('<4sHHd')  # magic, version, number of columns, timestep
+RECORD_NAME_LEN = 16
+RECORD_COLUMNS = ('sub0_bytes', 'sub1_bytes', 'recv_ofo_buff')
+
+
 class record(object):
-    """docstring for record."""
-    def __init__(self, timestep=0.2, datafile="record"):
+    """Append-only binary record of info.get_info samples.
+
+    The file is a header (magic, version, column count, timestep, one
+    16 byte name per column) followed by fixed-size rows of little endian
+    uint64. Rows are written as they are put and flushed every
+    flush_every rows, so nothing accumulates in memory and a crashed run
+    keeps everything up to the last flush. load() maps the rows with
+    numpy.memmap; files in the old text format are still read.
+    """
+    def __init__(self, timestep=0.2, datafile="record", columns=RECORD_COLUMNS, flush_every=25):
         self.data = []
         self.timestep = timestep
         self.datafile = datafile
+        self.columns = tuple(columns)
+        self.flush_every = flush_every
+        self.row = struct.Struct('<%dQ' % len(self.columns))
+        self.fp = None
+        self.lenth = 0
+
+    def open(self):
+        self.fp = open(self.datafile, 'wb')
+        self.fp.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, len(self.columns), self.timestep))
+        for name in self.columns:
+            self.fp.write(name.encode('ascii')[:RECORD_NAME_LEN].ljust(RECORD_NAME_LEN, b'\0'))
+        self.fp.flush()
+
+    def put(self, recd):
+        if self.fp is None:
+            self.open()
+        self.fp.write(self.row.pack(*recd))
+        self.lenth = self.lenth + 1
+        if self.lenth % self.flush_every == 0:
+            self.fp.flush()
 
     def save(self):
-        lenth = len(self.data)
-        with open(self.datafile, 'w') as f:
-            f.write(str(self.timestep))
-            f.write('\n')
-            f.write(str(lenth))
-            f.write('\n')
-            for i in range(lenth):
-                f.write('%d %d %d\n' % (self.data[i][0], self.data[i][1], self.data[i][2]))
-        f.close()
+        if self.fp is None:
+            self.open()
+        self.fp.close()
+        self.fp = None
 
     def load(self, datafile):
+        import numpy as np
+
+        self.datafile = datafile
+        with open(datafile, 'rb') as f:
+            head = f.read(RECORD_HEADER.size)
+            if head[:4] != RECORD_MAGIC:
+                return self.load_text(datafile)
+            magic, version, ncols, self.timestep = RECORD_HEADER.unpack(head)
+            names = f.read(ncols * RECORD_NAME_LEN)
+        self.columns = tuple(names[i:i + RECORD_NAME_LEN].rstrip(b'\0').decode('ascii')
+                             for i in range(0, len(names), RECORD_NAME_LEN))
+        offset = RECORD_HEADER.size + ncols * RECORD_NAME_LEN
+        rows = (os.path.getsize(datafile) - offset) // (8 * ncols)
+        if rows == 0:
+            self.data = np.zeros((0, ncols), dtype='<u8')
+        else:
+            self.data = np.memmap(datafile, dtype='<u8', mode='r', offset=offset, shape=(rows, ncols))
+        self.lenth = rows
+        return self.data
+
+    def load_text(self, datafile):
         self.datafile = datafile
         try:
             f = open(datafile, 'r')
@@ -61,18 +119,123 @@ class record(object):
         finally:
             if f:
                 f.close()
-
-    def put(self, recd):
-        self.data.append(recd)
+        self.lenth = len(self.data)
+        return self.data
 
     def draw(self):
         pass
 
 
-def main():
+async def recv_connection(loop, conn, datafile, records, timestep, buff_size=65536, discard=False):
+    """ drain one sender on the event loop, records[fd] is sampled by sample_records.
+
+    File writes run in the default executor so a slow disk never stalls
+    the other connections; two buffers let the next recv overlap the
+    write of the previous chunk. discard drops the payload.
+    """
+    conn.setblocking(False)
+    fd = conn.fileno()
+    info.persist_state(fd)
+    buff = await loop.sock_recv(conn, 2048)
+    filename = str(buff, encoding='utf8')
+    try:
+        fp = None if discard else open(filename, 'wb')
+    except OSError:
+        print("open file error.\n")
+        await loop.sock_sendall(conn, bytes("open file error.", encoding='utf8'))
+        conn.close()
+        return
+    await loop.sock_sendall(conn, bytes("ok", encoding='utf8'))
+
+    r = record(timestep=timestep, datafile=datafile)
+    records[fd] = r
+    views = [memoryview(bytearray(buff_size)) for _ in range(2)]
+    writing = None
+    try:
+        i = 0
+        while True:
+            n = await loop.sock_recv_into(conn, views[i])
+            if writing is not None:
+                await writing
+                writing = None
+            if n == 0:
+                break
+            if fp is not None:
+                writing = loop.run_in_executor(None, fp.write, views[i][:n])
+            i ^= 1
+    finally:
+        if writing is not None:
+            await asyncio.wait([writing])  # 缓冲区释放前等写完
+        del records[fd]
+        r.save()
+        if fp is not None:
+            fp.close()
+        conn.close()
+    print("recieve file {} from sender finished{}.".format(filename, " (discarded)" if discard else ""))
+
+
+async def sample_records(loop, records, timestep):
+    """ one shared timer samples info.get_info for every open connection """
+    deadline = loop.time()
+    while True:
+        deadline += timestep
+        await asyncio.sleep(max(deadline - loop.time(), 0))
+        for fd, r in list(records.items()):
+            data = info.get_info(fd)
+            if len(data) != 0:
+                r.put(data)
+
+
+async def serve(host='', port=6669, timestep=0.2, buff_size=65536, discard=False):
+    loop = asyncio.get_running_loop()
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(128)
+    server.setblocking(False)
+
+    records = {}
+    tasks = set()  # 事件循环只持有task的弱引用
+    sampler = loop.create_task(sample_records(loop, records, timestep))
+    num = 0
+    try:
+        while True:
+            c, addr = await loop.sock_accept(server)
+            print('connect addr : {}'.format(addr))
+            task = loop.create_task(recv_connection(loop, c, "record{}".format(num), records, timestep, buff_size,
+                                                    discard))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            num = num + 1
+    finally:
+        sampler.cancel()
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='MPTCP receiver')
+    parser.add_argument('--asyncio', action='store_true',
+                        help='serve many senders at once on one event loop')
+    parser.add_argument('--port', type=int, default=6669)
+    parser.add_argument('--timestep', type=float, default=0.2)
+    parser.add_argument('--mode', default=None, choices=MODES,
+                        help='receive engine of the threaded server (default: recv)')
+    parser.add_argument('--chunk', type=int, default=None,
+                        help='receive buffer size (default: 2048, 65536 with --asyncio)')
+    parser.add_argument('--discard', action='store_true',
+                        help='drop the payload instead of writing the file')
+    args = parser.parse_args(argv)
+
+    if args.asyncio:
+        if args.mode is not None:
+            parser.error("--mode only applies to the threaded server, --asyncio always uses sock_recv_into")
+        asyncio.run(serve(port=args.port, timestep=args.timestep, buff_size=args.chunk or 65536,
+                          discard=args.discard))
+        return
+
     server = socket.socket()
     host = '*'
-    port = 6669
+    port = args.port
     server.bind((host, port))
 
     server.listen(1)
@@ -81,11 +244,11 @@ def main():
         c, addr = server.accept()
         print('connect addr : {}'.format(addr))
         fd = c.fileno()
-        io = recv_thread(c)
+        io = recv_thread(c, buff_size=args.chunk or 2048, mode=args.mode or 'recv', discard=args.discard)
         info.persist_state(fd)
         io.start()
 
-        timestep = 0.2
+        timestep = args.timestep
         r = record(timestep=timestep, datafile="record{}".format(num))
         time.sleep(1)
         while True:
@@ -0,0 +1,193 @@
+"""
+多分辨率吞吐量缓存
+
+第一次读取 pcap 或 mptcplog 的 _out.txt 时，按 1ms 为基本单位求和，
+再汇总出 10ms / 100ms / 1s 的结果和 1ms 的累加和，一起保存为
+<输入文件>.rollup.npz。起始时间向下取整到最粗的分辨率，所以每一级的
+时间段都从该分辨率的整数倍开始，和直接按该分辨率统计的结果相同。
+之后任意分辨率（基本单位的整数倍）的吞吐量曲线、任意时间段的数据量都
+直接从缓存得到，不需要重新扫描原始数据。输入文件比缓存新、或者
+--src/--dst 过滤条件不同时自动重建。
+
+    python rollup.py eth.pcap s_2_2.cap_port0_out.txt --res 0.05
+"""
+import argparse
+import os
+
+import numpy as np
+
+
+RESOLUTIONS = (0.001, 0.01, 0.1, 1.0)
+
+
+def _key(resolution):
+    return 'r%dus' % int(round(resolution * 1e6))
+
+
+def _ratio(resolution, base):
+    m = int(round(resolution / base))
+    if m < 1 or abs(m * base - resolution) > 1e-9 * max(resolution, 1):
+        raise ValueError("resolution {} is not a multiple of {}".format(resolution, base))
+    return m
+
+
+def _aggregate(data, m):
+    """ sum every m columns of (flows, n), the last partial bin included """
+    n = data.shape[1]
+    pad = (-n) % m
+    if pad:
+        data = np.concatenate([data, np.zeros((data.shape[0], pad), dtype=data.dtype)], axis=1)
+    return data.reshape(data.shape[0], -1, m).sum(2)
+
+
+def load_out_txt(path, base=RESOLUTIONS[0], align=RESOLUTIONS[-1]):
+    """ mptcplog.c output (timestamp \\t payload length) -> (t0, flows, (1, n) bytes),
+        t0 is the first timestamp rounded down to align """
+    raw = np.loadtxt(path, delimiter='\t', ndmin=2)
+    if len(raw) == 0:
+        return 0.0, [path], np.zeros((1, 0), dtype=np.int64)
+    t0 = np.floor(raw[:, 0].min() / align) * align
+    b = np.floor((raw[:, 0] - t0) / base + 1e-9).astype(np.int64)
+    data = np.bincount(b, weights=raw[:, 1]).astype(np.int64)
+    return t0, [path], data[None]
+
+
+def load_pcap(path, base=RESOLUTIONS[0], src=None, dst=None, align=RESOLUTIONS[-1]):
+    """ pcap_analyze.throughput at base from the first packet rounded down to align """
+    from pcap_analyze import iter_packets, throughput
+
+    start = None
+    for pkts in iter_packets(path, src, dst):
+        if len(pkts):
+            start = np.floor(pkts['ts'][0] / align) * align
+            break
+    if start is None:
+        return 0.0, [], np.zeros((0, 0), dtype=np.int64)
+    t0, flows, data = throughput(path, base, src, dst, start=start)
+    flows = ['{}:{}->{}:{}'.format(f[0], f[2], f[1], f[3]) for f in flows]
+    return t0, flows, data.astype(np.int64)
+
+
+class Rollup(object):
+    """ per flow byte counts at several resolutions plus the base resolution cumsum """
+
+    def __init__(self, t0, flows, base_data, resolutions=RESOLUTIONS, src=None, dst=None):
+        self.t0 = float(t0)
+        self.flows = list(flows)
+        self.src = src
+        self.dst = dst
+        self.resolutions = tuple(sorted(resolutions))
+        self.base = self.resolutions[0]
+        self.levels = {}
+        for r in self.resolutions:
+            self.levels[r] = _aggregate(base_data, _ratio(r, self.base))
+        self.cumsum = np.zeros((base_data.shape[0], base_data.shape[1] + 1), dtype=np.int64)
+        np.cumsum(base_data, axis=1, out=self.cumsum[:, 1:])
+
+    @classmethod
+    def from_arrays(cls, t0, flows, resolutions, levels, cumsum, src=None, dst=None):
+        self = cls.__new__(cls)
+        self.t0 = float(t0)
+        self.flows = list(flows)
+        self.src = src
+        self.dst = dst
+        self.resolutions = tuple(resolutions)
+        self.base = self.resolutions[0]
+        self.levels = dict(zip(self.resolutions, levels))
+        self.cumsum = cumsum
+        return self
+
+    def save(self, path):
+        arrays = {_key(r): self.levels[r] for r in self.resolutions}
+        np.savez(path, t0=self.t0, flows=np.array(self.flows, dtype=str),
+                 resolutions=np.array(self.resolutions), cumsum=self.cumsum,
+                 filter=np.array([self.src or '', self.dst or ''], dtype=str), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """ the cached Rollup, None for a cache written before src/dst were stored """
+        with np.load(path) as f:
+            if 'filter' not in f.files:
+                return None
+            src, dst = (str(s) or None for s in f['filter'])
+            resolutions = tuple(float(r) for r in f['resolutions'])
+            return cls.from_arrays(float(f['t0']), [str(s) for s in f['flows']], resolutions,
+                                   [f[_key(r)] for r in resolutions], f['cumsum'], src, dst)
+
+    @property
+    def duration(self):
+        return (self.cumsum.shape[1] - 1) * self.base
+
+    def series(self, resolution):
+        """ (bin start times, (flows, n) bytes per bin) at any multiple of the base """
+        if resolution in self.levels:
+            data = self.levels[resolution]
+        else:
+            m = _ratio(resolution, self.base)
+            idx = np.arange(0, self.cumsum.shape[1] - 1 + m, m)
+            idx[-1] = min(idx[-1], self.cumsum.shape[1] - 1)
+            data = np.diff(self.cumsum[:, idx], axis=1)
+        return self.t0 + np.arange(data.shape[1]) * resolution, data
+
+    def throughput(self, resolution):
+        """ (bin start times, (flows, n) bytes per second) """
+        times, data = self.series(resolution)
+        return times, data / resolution
+
+    def bytes_between(self, start, end):
+        """ per flow bytes in [start, end), absolute timestamps rounded to the base """
+        n = self.cumsum.shape[1] - 1
+        lo = int(np.clip(np.floor((start - self.t0) / self.base + 1e-9), 0, n))
+        hi = int(np.clip(np.floor((end - self.t0) / self.base + 1e-9), 0, n))
+        return self.cumsum[:, max(hi, lo)] - self.cumsum[:, lo]
+
+
+def cache_path(source):
+    return source + '.rollup.npz'
+
+
+def build(source, resolutions=RESOLUTIONS, src=None, dst=None):
+    base, align = min(resolutions), max(resolutions)
+    if source.endswith('_out.txt'):
+        t0, flows, data = load_out_txt(source, base, align)
+    else:
+        t0, flows, data = load_pcap(source, base, src, dst, align)
+    return Rollup(t0, flows, data, resolutions, src, dst)
+
+
+def rollup(source, resolutions=RESOLUTIONS, src=None, dst=None, rebuild=False):
+    """ the Rollup of source, from the cache when it is newer than source and has the same src/dst """
+    path = cache_path(source)
+    if not rebuild and os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+        r = Rollup.load(path)
+        if r is not None and (r.src, r.dst) == (src, dst) and set(resolutions) <= set(r.resolutions):
+            return r
+    r = build(source, resolutions, src, dst)
+    r.save(path)
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description='multi-resolution throughput cache')
+    parser.add_argument('source', nargs='+', help='pcap files or mptcplog _out.txt files')
+    parser.add_argument('--res', type=float, default=None,
+                        help='also write <source>_flow<i>_throughput.txt at this resolution')
+    parser.add_argument('--src', default=None)
+    parser.add_argument('--dst', default=None)
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+
+    for source in args.source:
+        r = rollup(source, src=args.src, dst=args.dst, rebuild=args.rebuild)
+        print("{}: {} flows, {:.3f}s, cache {}".format(source, len(r.flows), r.duration, cache_path(source)))
+        if args.res is None:
+            continue
+        from pcap_analyze import save_throughput
+
+        _, data = r.series(args.res)
+        for i, (flow, name) in enumerate(zip(r.flows, save_throughput(source, r.t0, args.res, r.flows, data))):
+            print("  {} {} bytes -> {}".format(flow, int(r.cumsum[i, -1]), name))
+
+
+if __name__ == '__main__':
+    main()
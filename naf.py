@@ -5,20 +5,11 @@ import torch.nn as nn
 from torch.optim import Adam
 from torch.autograd import Variable
 import torch.nn.functional as F
+from target_update import soft_update, hard_update
 
 MSELoss = nn.MSELoss()
 
 
-def soft_update(target, source, tau):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
-
-
-def hard_update(target, source):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(param.data)
-
-
 class Policy(nn.Module):
 
     def __init__(self, hidden_size, num_inputs, action_space):
@@ -85,6 +76,9 @@ class Policy(nn.Module):
 
 
 class NAF:
+    action_bounds = (1, 4)  # select_action clamps to [low, high]
+    mask = False  # one row per sample, no padded rows
+
 
     def __init__(self, gamma, tau, hidden_size, num_inputs, action_space):
         self.action_space = action_space
@@ -99,6 +93,18 @@ class NAF:
 
         hard_update(self.target_model, self.model)
 
+    def state_dict(self):
+        return {
+            'model': self.model.state_dict(),
+            'target_model': self.target_model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.model.load_state_dict(state['model'])
+        self.target_model.load_state_dict(state['target_model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+
     def select_action(self, state, exploration=None):
         self.model.eval()
         mu, _, _ = self.model((Variable(state, volatile=True), None))
@@ -107,14 +113,16 @@ class NAF:
         if exploration is not None:
             mu += torch.Tensor(exploration.noise())
 
-        return mu.clamp(1, 4)
+        return mu.clamp(*self.action_bounds)
 
-    def update_parameters(self, batch):
-        state_batch = Variable(torch.cat(batch.state))
-        next_state_batch = Variable(torch.cat(batch.next_state), volatile=True)
-        action_batch = Variable(torch.cat(batch.action))
-        reward_batch = Variable(torch.cat(batch.reward))
-        mask_batch = Variable(torch.cat(batch.mask))
+    def update_parameters(self, batch, weights=None):
+        """ one gradient step, returns the absolute TD error of every transition.
+            weights are importance-sampling weights of a prioritized sample """
+        state_batch = Variable(batch.state)
+        next_state_batch = Variable(batch.next_state, volatile=True)
+        action_batch = Variable(batch.action)
+        reward_batch = Variable(batch.reward)
+        mask_batch = Variable(batch.mask)
 
         _, _, next_state_values = self.target_model((next_state_batch, None))
 
@@ -123,7 +131,11 @@ class NAF:
 
         _, state_action_values, _ = self.model((state_batch, action_batch))
 
-        loss = MSELoss(state_action_values, expected_state_action_values)
+        if weights is None:
+            loss = MSELoss(state_action_values, expected_state_action_values)
+        else:
+            weights = Variable(weights).view(-1, 1)
+            loss = (weights * (state_action_values - expected_state_action_values) ** 2).mean()
 
         self.optimizer.zero_grad()
         loss.backward()
@@ -131,3 +143,6 @@ class NAF:
         self.optimizer.step()
 
         soft_update(self.target_model, self.model, self.tau)
+
+        td = (expected_state_action_values - state_action_values).data
+        return td.view(-1).abs()
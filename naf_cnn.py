@@ -5,65 +5,21 @@ import torch.nn as nn
 from torch.optim import Adam
 from torch.autograd import Variable
 import torch.nn.functional as F
+from cnn_encoder import GroupedConvEncoder
+from target_update import soft_update, hard_update
 
 MSELoss = nn.MSELoss()
 
 
-def soft_update(target, source, tau):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
-
-
-def hard_update(target, source):
-    for target_param, param in zip(target.parameters(), source.parameters()):
-        target_param.data.copy_(param.data)
-
-
 class Policy(nn.Module):
 
-    def __init__(self, hidden_size, num_inputs, action_space):
+    def __init__(self, hidden_size, num_inputs, action_space, subflows=2, k=8):
         super(Policy, self).__init__()
         self.action_space = action_space
         num_outputs = action_space.shape[0]
 
-        self.conv1 = nn.Sequential(
-            nn.Conv1d(
-                in_channels=2,
-                out_channels=16,
-                kernel_size=4,
-                stride=1,
-                padding=1,
-            ),
-            nn.ReLU(),
-            nn.MaxPool1d(kernel_size=2),
-        )
-        self.out1 = nn.Linear(48, 16)
-
-        self.conv2 = nn.Sequential(
-            nn.Conv1d(
-                in_channels=2,
-                out_channels=16,
-                kernel_size=4,
-                stride=1,
-                padding=1,
-            ),
-            nn.ReLU(),
-            nn.MaxPool1d(kernel_size=2),
-        )
-        self.out2 = nn.Linear(48, 16)
-
-        self.conv3 = nn.Sequential(
-            nn.Conv1d(
-                in_channels=2,
-                out_channels=16,
-                kernel_size=4,
-                stride=1,
-                padding=1,
-            ),
-            nn.ReLU(),
-            nn.MaxPool1d(kernel_size=2),
-        )
-        self.out3 = nn.Linear(48, 16)
+        self.subflows = subflows
+        self.encoder = GroupedConvEncoder(subflows, k, groups=3)
 
         self.bn0 = nn.BatchNorm1d(num_inputs)
         self.bn0.weight.data.fill_(1)
@@ -98,30 +54,9 @@ class Policy(nn.Module):
 
     def forward(self, inputs):
         inputs, u = inputs
-        cnn1 = inputs[:, 0:8].contiguous()
-        cnn1 = cnn1.view(1, 2, 8)
-        cnn1 = self.conv1(cnn1)
-        cnn1 = cnn1.view(cnn1.size(0), -1)
-        cnn1 = self.out1(cnn1)
-        cnn1 = cnn1.view(2, 8)
-
-        cnn2 = inputs[:, 8:16].contiguous()
-        cnn2 = cnn2.view(1, 2, 8)
-        cnn2 = self.conv2(cnn2)
-        cnn2 = cnn2.view(cnn2.size(0), -1)
-        cnn2 = self.out2(cnn2)
-        cnn2 = cnn2.view(2, 8)
-
-        cnn3 = inputs[:, 16:24].contiguous()
-        cnn3 = cnn3.view(1, 2, 8)
-        cnn3 = self.conv3(cnn3)
-        cnn3 = cnn3.view(cnn3.size(0), -1)
-        cnn3 = self.out3(cnn3)
-        cnn3 = cnn3.view(2, 8)
-
-        x = torch.cat((cnn1, cnn2), 1)
-        x = torch.cat((x, cnn3), 1)
-        x = torch.cat((x, inputs[:, 24:]), 1)
+        x = inputs.view(-1, self.subflows, inputs.size(-1))
+        x = self.encoder(x)
+        x = x.view(-1, x.size(-1))
 
         x = self.bn0(x)
         x = F.tanh(self.linear1(x))
@@ -149,13 +84,16 @@ class Policy(nn.Module):
 
 
 class NAF_CNN:
+    action_bounds = (1, 4)  # select_action clamps to [low, high]
 
-    def __init__(self, gamma, tau, hidden_size, num_inputs, action_space):
+    def __init__(self, gamma, tau, hidden_size, num_inputs, action_space, subflows=2, k=8, mask=False):
         self.action_space = action_space
         self.num_inputs = num_inputs
+        self.subflows = subflows
+        self.mask = mask  # 最后一列是 active，补齐的子流动作为0、不参与损失
 
-        self.model = Policy(hidden_size, num_inputs, action_space)
-        self.target_model = Policy(hidden_size, num_inputs, action_space)
+        self.model = Policy(hidden_size, num_inputs, action_space, subflows, k)
+        self.target_model = Policy(hidden_size, num_inputs, action_space, subflows, k)
         self.optimizer = Adam(self.model.parameters(), lr=1e-3)
 
         self.gamma = gamma
@@ -163,6 +101,18 @@ class NAF_CNN:
 
         hard_update(self.target_model, self.model)
 
+    def state_dict(self):
+        return {
+            'model': self.model.state_dict(),
+            'target_model': self.target_model.state_dict(),
+            'optimizer': self.optimizer.state_dict(),
+        }
+
+    def load_state_dict(self, state):
+        self.model.load_state_dict(state['model'])
+        self.target_model.load_state_dict(state['target_model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+
     def select_action(self, state, exploration=None):
         self.model.eval()
         mu, _, _ = self.model((Variable(state, volatile=True), None))
@@ -171,23 +121,39 @@ class NAF_CNN:
         if exploration is not None:
             mu += torch.Tensor(exploration.noise())
 
-        return mu.clamp(1, 4)
+        mu = mu.clamp(*self.action_bounds)
+        if self.mask:
+            mu.mul_(state[..., -1:])
+        return mu
 
-    def update_parameters(self, batch):
-        state_batch = Variable(torch.cat(batch.state))
-        next_state_batch = Variable(torch.cat(batch.next_state), volatile=True)
-        action_batch = Variable(torch.cat(batch.action))
-        reward_batch = Variable(torch.cat(batch.reward))
-        mask_batch = Variable(torch.cat(batch.mask))
+    def update_parameters(self, batch, weights=None):
+        """ one gradient step, returns the absolute TD error of every transition.
+            weights are importance-sampling weights of a prioritized sample """
+        state_batch = Variable(batch.state)
+        next_state_batch = Variable(batch.next_state, volatile=True)
+        action_batch = Variable(batch.action)
+        reward_batch = Variable(batch.reward)
+        mask_batch = Variable(batch.mask)
 
         _, _, next_state_values = self.target_model((next_state_batch, None))
 
-        reward_batch = (torch.unsqueeze(reward_batch, 1))
+        # one row per subflow, every subflow of a transition shares its reward
+        reward_batch = reward_batch.view(-1, 1).repeat(1, self.subflows).view(-1, 1)
         expected_state_action_values = reward_batch + (next_state_values * self.gamma)
 
         _, state_action_values, _ = self.model((state_batch, action_batch))
 
-        loss = MSELoss(state_action_values, expected_state_action_values)
+        if weights is not None:
+            weights = Variable(weights).view(-1, 1).repeat(1, self.subflows).view(-1, 1)
+        if self.mask:
+            active = state_batch[:, -1:]
+            weights = active if weights is None else weights * active
+        if weights is None:
+            loss = MSELoss(state_action_values, expected_state_action_values)
+        else:
+            loss = (weights * (state_action_values - expected_state_action_values) ** 2).mean()
+        if self.mask:
+            loss = loss * (active.numel() / active.sum().clamp(min=1))  # 只对真实子流求平均
 
         self.optimizer.zero_grad()
         loss.backward()
@@ -195,3 +161,9 @@ class NAF_CNN:
         self.optimizer.step()
 
         soft_update(self.target_model, self.model, self.tau)
+
+        td = (expected_state_action_values - state_action_values).data.abs()
+        if self.mask:
+            active = active.data.view(-1, self.subflows)
+            return (td.view(-1, self.subflows) * active).sum(1) / active.sum(1).clamp(min=1)
+        return td.view(-1, self.subflows).mean(1)
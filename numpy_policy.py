@@ -0,0 +1,149 @@
+import numpy as np
+
+
+def export_npz(agent, path):
+    """ write the acting network of a NAF / DDPG agent (CNN or not) to one .npz
+
+    Only the layers select_action runs are kept: the conv encoder, bn0
+    (with its running statistics), linear1, linear2 and mu.
+    """
+    net = agent.actor if hasattr(agent, 'actor') else agent.model
+    arrays = {}
+    for name, value in net.state_dict().items():
+        if name.split('.')[0] in ('encoder', 'bn0', 'linear1', 'linear2', 'mu'):
+            arrays[name] = value.detach().cpu().numpy()
+    meta = {'low': agent.action_bounds[0], 'high': agent.action_bounds[1], 'bn_eps': net.bn0.eps,
+            'mask': agent.mask}
+    encoder = getattr(net, 'encoder', None)
+    if encoder is not None:
+        meta.update(subflows=encoder.subflows, k=encoder.k, groups=encoder.groups,
+                    channels=encoder.channels)
+    for key, value in meta.items():
+        arrays['meta.' + key] = np.array(value)
+    np.savez(path, **arrays)
+
+
+class NumpyPolicy(object):
+    """ select_action of an exported agent in plain NumPy.
+
+    Evaluates exactly what the agent does in eval mode: the grouped conv
+    encoder (CNN agents), bn0 with running statistics folded into one
+    scale and shift, then tanh(linear1), tanh(linear2), tanh(mu), noise
+    and the clamp to the agent's action bounds, then zero for padded
+    subflow rows of a masked agent. No torch import.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as f:
+            p = {key: f[key] for key in f.files}
+        self.low = float(p['meta.low'])
+        self.high = float(p['meta.high'])
+        self.mask = bool(p['meta.mask']) if 'meta.mask' in p else False
+
+        scale = p['bn0.weight'] / np.sqrt(p['bn0.running_var'] + float(p['meta.bn_eps']))
+        self.bn_scale = scale
+        self.bn_shift = p['bn0.bias'] - p['bn0.running_mean'] * scale
+        self.w1, self.b1 = p['linear1.weight'].T.copy(), p['linear1.bias']
+        self.w2, self.b2 = p['linear2.weight'].T.copy(), p['linear2.bias']
+        self.wmu, self.bmu = p['mu.weight'].T.copy(), p['mu.bias']
+
+        self.cnn = 'meta.subflows' in p
+        if self.cnn:
+            self.subflows = int(p['meta.subflows'])
+            self.k = int(p['meta.k'])
+            self.groups = int(p['meta.groups'])
+            self.channels = int(p['meta.channels'])
+            G, C, S, k = self.groups, self.channels, self.subflows, self.k
+            conv_w = p['encoder.conv.0.weight']  # (G*C, S, 4)
+            self.kernel = conv_w.shape[-1]
+            self.conv_w = conv_w.reshape(G, C, S, self.kernel)
+            self.conv_b = p['encoder.conv.0.bias'].reshape(1, G, C, 1)
+            out_w = p['encoder.out.weight']  # (G*S*k, C*L, 1)
+            self.out_w = out_w.reshape(G, S * k, -1)
+            self.out_b = p['encoder.out.bias'].reshape(1, G, S * k)
+
+    def encode(self, x):
+        """ GroupedConvEncoder.forward, x is (B, S, D) """
+        B = x.shape[0]
+        G, C, S, k = self.groups, self.channels, self.subflows, self.k
+        width = G * k
+        h = x[:, :, :width].reshape(B, S, G, k).transpose(0, 2, 1, 3)  # (B, G, S, k)
+        h = np.pad(h, ((0, 0), (0, 0), (0, 0), (1, 1)))
+        L = k + 2 - self.kernel + 1
+        y = np.zeros((B, G, C, L), dtype=x.dtype)
+        for j in range(self.kernel):
+            y += np.einsum('bgsl,gcs->bgcl', h[..., j:j + L], self.conv_w[..., j])
+        y += self.conv_b
+        np.maximum(y, 0, out=y)
+        L2 = L // 2
+        y = y[..., :2 * L2].reshape(B, G, C, L2, 2).max(-1)
+        y = np.einsum('bgi,goi->bgo', y.reshape(B, G, C * L2), self.out_w) + self.out_b
+        y = y.reshape(B, G, S, k).transpose(0, 2, 1, 3).reshape(B, S, width)
+        return np.concatenate((y, x[:, :, width:]), 2)
+
+    def forward(self, state):
+        x = np.asarray(state, dtype=np.float32)
+        d = x.shape[-1]
+        if self.cnn:
+            x = self.encode(x.reshape(-1, self.subflows, d))
+        x = x.reshape(-1, d) * self.bn_scale + self.bn_shift
+        x = np.tanh(x.dot(self.w1) + self.b1)
+        x = np.tanh(x.dot(self.w2) + self.b2)
+        return np.tanh(x.dot(self.wmu) + self.bmu)
+
+    def select_action(self, state, exploration=None):
+        mu = self.forward(state)
+        if exploration is not None:
+            mu += exploration.noise()
+        np.clip(mu, self.low, self.high, out=mu)
+        if self.mask:
+            state = np.asarray(state)
+            mu *= state.reshape(-1, state.shape[-1])[:, -1:]
+        return mu
+
+
+def benchmark(n=2000, path='/tmp/numpy_policy.npz'):
+    """ NumpyPolicy vs agent.select_action: max abs difference and per decision time """
+    import time
+    import torch
+    from gym import spaces
+    from naf_cnn import NAF_CNN
+    from ddpg_cnn import DDPG_CNN
+    from naf import NAF
+    from ddpg import DDPG
+
+    torch.set_num_threads(1)
+    action_space = spaces.Box(np.array([1]), np.array([4]))
+    for cls in (NAF_CNN, DDPG_CNN, NAF, DDPG):
+        agent = cls(0.99, 0.001, 128, 26, action_space)
+        net = agent.actor if hasattr(agent, 'actor') else agent.model
+        # non-trivial running statistics
+        net.bn0.running_mean.uniform_(-1, 1)
+        net.bn0.running_var.uniform_(0.5, 2)
+        export_npz(agent, path)
+        policy = NumpyPolicy(path)
+
+        # compare before the clamp, tanh outputs would all clamp to the same bound
+        state = torch.rand(64, 26) * 4
+        net.eval()
+        with torch.no_grad():
+            mu = net(state) if hasattr(agent, 'actor') else net((state, None))[0]
+        net.train()
+        err = np.abs(mu.numpy() - policy.forward(state.numpy())).max()
+
+        state = torch.rand(2, 26)
+        start = time.perf_counter()
+        for _ in range(n):
+            agent.select_action(state)
+        t_torch = (time.perf_counter() - start) / n * 1e6
+        state = state.numpy()
+        start = time.perf_counter()
+        for _ in range(n):
+            policy.select_action(state)
+        t_numpy = (time.perf_counter() - start) / n * 1e6
+        print("{:>8}: max abs diff {:.2e}, torch {:7.1f} us, numpy {:7.1f} us".format(
+            cls.__name__, err, t_torch, t_numpy))
+
+
+if __name__ == '__main__':
+    benchmark()
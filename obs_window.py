@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class ObservationWindow(object):
+    """ k 个时间片的观测窗口
+
+    hist 保存每个子流每个特征最近的 k 个值，每个值同时写在第 p 列和第 p+k 列，
+    因此 hist[..., pos:pos+k] 总是按时间顺序排列的连续窗口，不需要移动数据。
+    obs 是预先分配好的观测 (subflows, features * k + extra)，observation()
+    只把窗口复制进去，不产生新的对象。batch 不为 None 时所有数组多一个前导维度。
+
+    mask=True 时 subflows 是补齐后的行数，obs 最后多一列 active：本时间片
+    存在的子流为 1，补齐的行为 0，补齐行的历史值也清零。
+    """
+
+    def __init__(self, subflows, k, features=3, extra=2, batch=None, dtype=np.float32, mask=False):
+        lead = () if batch is None else (batch,)
+        self.subflows = subflows
+        self.k = k
+        self.features = features
+        self.extra = extra
+        self.mask = mask
+        width = features * k + extra
+        self.hist = np.zeros(lead + (subflows, features, 2 * k), dtype=dtype)
+        self.obs = np.zeros(lead + (subflows, width + int(mask)), dtype=dtype)
+        self._obs_hist = self.obs[..., :features * k].reshape(lead + (subflows, features, k))
+        self._obs_extra = self.obs[..., features * k:width]
+        self.active = self.obs[..., width] if mask else None  ##每行是否是真实子流
+        assert np.shares_memory(self._obs_hist, self.obs)
+        self.pos = 0
+
+    def reset(self):
+        self.hist.fill(0)
+        self.obs.fill(0)
+        self.pos = 0
+
+    def push(self, values, active=None):
+        """ values: (..., n, features)，写入当前时间片，n <= subflows
+            active: (..., subflows) 每行是否有效，默认前 n 行有效（只在 mask=True 时使用） """
+        values = np.asarray(values)
+        if values.size == 0:
+            return
+        n = values.shape[-2]
+        p = self.pos
+        self.hist[..., :n, :, p] = values
+        self.hist[..., :n, :, p + self.k] = values
+        if self.mask:
+            self.hist[..., n:, :, p] = 0
+            self.hist[..., n:, :, p + self.k] = 0
+            if active is None:
+                self.active[..., :n] = 1
+                self.active[..., n:] = 0
+            else:
+                self.active[...] = active
+        self.pos = (p + 1) % self.k
+
+    def series(self, feature):
+        """ (..., subflows, k) 某个特征按时间顺序的视图 """
+        return self.hist[..., feature, self.pos:self.pos + self.k]
+
+    def observation(self, extra=None):
+        np.copyto(self._obs_hist, self.hist[..., self.pos:self.pos + self.k])
+        if extra is not None:
+            self._obs_extra[...] = extra
+            if self.mask:
+                self._obs_extra *= self.active[..., None]  # 补齐行的额外特征也清零
+        return self.obs
@@ -106,8 +106,7 @@ for i_episode in range(args.num_episodes):
 
             if len(memory) > args.batch_size * 5:
                 for _ in range(args.updates_per_step):
-                    transitions = memory.sample(args.batch_size)
-                    batch = Transition(*zip(*transitions))
+                    batch = memory.sample(args.batch_size)
 
                     agent.update_parameters(batch)
 
@@ -1,6 +1,13 @@
+import copy
+
 import numpy as np
 
 
+def annealed_scale(initial, final, exploration_end, i_episode):
+    """ noise scale of episode i_episode, linear from initial to final over exploration_end episodes """
+    return (initial - final) * max(0, exploration_end - i_episode) / exploration_end + final
+
+
 # from https://github.com/songrotek/DDPG/blob/master/ou_noise.py
 class OUNoise:
 
@@ -21,3 +28,163 @@ class OUNoise:
         dx = self.theta * (self.mu - x) + self.sigma * np.random.randn(len(x))
         self.state = x + dx
         return self.state * self.scale
+
+
+class _StreamNormals(object):
+    """ standard normals for num_streams independent, separately seeded streams.
+
+    Stream i draws from its own Generator spawned from SeedSequence(seed),
+    so it yields the same sequence for a given seed no matter how many
+    streams there are or how the draws are blocked. Draws are pregenerated
+    `block` steps at a time, so a call is just an index into the block.
+    """
+
+    def __init__(self, num_streams, shape, seed=None, block=256):
+        self.num_streams = num_streams
+        self.shape = tuple(shape)
+        self.block = block
+        self.seed = np.random.SeedSequence(seed)
+        self.rngs = [np.random.default_rng(s) for s in self.seed.spawn(num_streams)]
+        self.buf = np.empty((num_streams, block) + self.shape)
+        self.pos = block
+
+    def refill(self):
+        for rng, buf in zip(self.rngs, self.buf):
+            rng.standard_normal(out=buf)
+        self.pos = 0
+
+    def next(self):
+        """ (num_streams,) + shape, valid until the next refill """
+        if self.pos == self.block:
+            self.refill()
+        out = self.buf[:, self.pos]
+        self.pos += 1
+        return out
+
+    def take(self, steps):
+        """ (steps, num_streams) + shape, a copy """
+        out = np.empty((steps, self.num_streams) + self.shape)
+        i = 0
+        while i < steps:
+            if self.pos == self.block:
+                self.refill()
+            n = min(steps - i, self.block - self.pos)
+            out[i:i + n] = np.moveaxis(self.buf[:, self.pos:self.pos + n], 1, 0)
+            self.pos += n
+            i += n
+        return out
+
+
+class OUNoiseBatch(object):
+    """ num_streams independent OU processes advanced in one vectorized step """
+
+    def __init__(self, num_streams, action_dimension, scale=0.1, mu=0, theta=0.15, sigma=0.2,
+                 seed=None, block=256):
+        self.num_streams = num_streams
+        self.action_dimension = action_dimension
+        self.scale = scale
+        self.mu = mu
+        self.theta = theta
+        self.sigma = sigma
+        self.normals = _StreamNormals(num_streams, (action_dimension,), seed, block)
+        self.state = np.full((num_streams, action_dimension), float(mu))
+        self.out = np.empty_like(self.state)
+
+    def reset(self, streams=None):
+        """ reset every stream, or only streams (indices or a boolean mask) """
+        if streams is None:
+            self.state.fill(self.mu)
+        else:
+            self.state[streams] = self.mu
+
+    def noise(self):
+        """ (num_streams, action_dimension), overwritten by the next call """
+        x = self.state
+        x += self.theta * (self.mu - x) + self.sigma * self.normals.next()
+        np.multiply(x, self.scale, out=self.out)
+        return self.out
+
+    def noise_block(self, steps):
+        """ the next steps noise vectors at once, (steps, num_streams, action_dimension) """
+        eps = self.normals.take(steps)
+        out = np.empty_like(eps)
+        x = self.state
+        for t in range(steps):
+            x += self.theta * (self.mu - x) + self.sigma * eps[t]
+            out[t] = x
+        out *= self.scale
+        return out
+
+
+class GaussianNoiseBatch(object):
+    """ num_streams independent N(mu, sigma^2) streams, same interface as OUNoiseBatch """
+
+    def __init__(self, num_streams, action_dimension, scale=0.1, mu=0, sigma=0.2, seed=None, block=256):
+        self.num_streams = num_streams
+        self.action_dimension = action_dimension
+        self.scale = scale
+        self.mu = mu
+        self.sigma = sigma
+        self.normals = _StreamNormals(num_streams, (action_dimension,), seed, block)
+        self.out = np.empty((num_streams, action_dimension))
+
+    def reset(self, streams=None):
+        pass
+
+    def noise(self):
+        np.multiply(self.normals.next(), self.sigma, out=self.out)
+        self.out += self.mu
+        self.out *= self.scale
+        return self.out
+
+    def noise_block(self, steps):
+        return (self.normals.take(steps) * self.sigma + self.mu) * self.scale
+
+
+class ParameterNoise(object):
+    """ Parameter-space noise for num_streams perturbed copies of one policy.
+
+    perturb(params) adds N(0, sigma^2) to every array in params (a dict
+    of name -> ndarray, e.g. the weights of a NumpyPolicy), independently
+    per stream. adapt(distance) grows sigma while the perturbed actions
+    stay closer than `desired` to the unperturbed ones and shrinks it
+    otherwise (Plappert et al., 2018).
+    """
+
+    def __init__(self, num_streams, sigma=0.1, desired=0.2, adoption=1.01, seed=None):
+        self.num_streams = num_streams
+        self.sigma = sigma
+        self.desired = desired
+        self.adoption = adoption
+        seeds = np.random.SeedSequence(seed).spawn(num_streams)
+        self.rngs = [np.random.default_rng(s) for s in seeds]
+
+    def perturb(self, params):
+        """ list of num_streams dicts with the same keys as params """
+        out = []
+        for rng in self.rngs:
+            out.append({name: value + self.sigma * rng.standard_normal(value.shape).astype(value.dtype)
+                        for name, value in params.items()})
+        return out
+
+    def perturb_policy(self, policy, names=('w1', 'w2', 'wmu')):
+        """ num_streams shallow copies of a NumpyPolicy with perturbed weights """
+        params = {name: getattr(policy, name) for name in names}
+        policies = []
+        for p in self.perturb(params):
+            perturbed = copy.copy(policy)
+            for name, value in p.items():
+                setattr(perturbed, name, value)
+            policies.append(perturbed)
+        return policies
+
+    def adapt(self, distance):
+        if distance > self.desired:
+            self.sigma /= self.adoption
+        else:
+            self.sigma *= self.adoption
+        return self.sigma
+
+    @staticmethod
+    def distance(actions, perturbed_actions):
+        return float(np.sqrt(np.mean(np.square(np.asarray(actions) - np.asarray(perturbed_actions)))))
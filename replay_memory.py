@@ -1,6 +1,11 @@
+import json
+import os
 import random
 from collections import namedtuple
 
+import numpy as np
+import torch
+
 # Taken from
 # https://github.com/pytorch/tutorials/blob/master/Reinforcement%20(Q-)Learning%20with%20PyTorch.ipynb
 
@@ -9,21 +14,262 @@ Transition = namedtuple(
 
 
 class ReplayMemory(object):
+    """ Ring buffer with one preallocated tensor per Transition field.
+
+    The tensors are allocated on the first push, shaped after that
+    transition, so memory use is fixed at capacity from then on.
+    sample() gathers a batch by index and returns a Transition whose
+    fields are already concatenated like torch.cat over the sampled
+    transitions would be.
+    """
 
     def __init__(self, capacity):
         self.capacity = capacity
-        self.memory = []
+        self.memory = None
         self.position = 0
+        self.size = 0
+
+    def _allocate(self, fields):
+        self.memory = Transition(*[torch.zeros((self.capacity,) + tuple(f.shape), dtype=f.dtype)
+                                   for f in fields])
 
     def push(self, *args):
         """Saves a transition."""
-        if len(self.memory) < self.capacity:
-            self.memory.append(None)
-        self.memory[self.position] = Transition(*args)
+        fields = [torch.as_tensor(a) for a in args]
+        if self.memory is None:
+            self._allocate(fields)
+        for buf, f in zip(self.memory, fields):
+            buf[self.position].copy_(f)
         self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
 
     def sample(self, batch_size):
-        return random.sample(self.memory, batch_size)
+        idx = torch.as_tensor(random.sample(range(self.size), batch_size))
+        return self.gather(idx)
+
+    def gather(self, idx):
+        return Transition(*[buf.index_select(0, idx).view((-1,) + tuple(buf.shape[2:]))
+                            for buf in self.memory])
 
     def __len__(self):
-        return len(self.memory)
+        return self.size
+
+
+class SumTree(object):
+    """ Array sum-tree over `capacity` leaves (rounded up to a power of two).
+
+    tree[1] is the total, the children of node i are 2i and 2i+1 and leaf
+    j is node size + j. update() and find() take whole index / value
+    arrays and walk the log2(size) levels once for the batch.
+    """
+
+    def __init__(self, capacity):
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.depth = self.size.bit_length() - 1
+        self.tree = np.zeros(2 * self.size)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[self.size + np.asarray(idx)]
+
+    def update(self, idx, priorities):
+        node = self.size + np.asarray(idx, dtype=np.int64).reshape(-1)
+        self.tree[node] = priorities
+        tree = self.tree
+        if len(node) == 1:  # push: a plain walk is cheaper than array ops
+            i = int(node[0]) >> 1
+            while i >= 1:
+                tree[i] = tree[2 * i] + tree[2 * i + 1]
+                i >>= 1
+            return
+        node = np.sort(node)
+        for _ in range(self.depth):
+            node >>= 1
+            node = node[np.concatenate(([True], node[1:] != node[:-1]))]  # sorted, so dedup is a shift
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+
+    def find(self, values):
+        """ leaf index of every value in [0, total) by proportional descent """
+        values = np.array(values, dtype=np.float64)
+        node = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * node
+            right = values >= self.tree[left]
+            values -= self.tree[left] * right
+            node = left + right
+        return node - self.size
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """ ReplayMemory sampled in proportion to priority ** alpha.
+
+    New transitions get the largest priority seen so far. sample_prioritized
+    draws one value per equal slice of the total (stratified) and returns
+    the batch, the slots and importance-sampling weights
+    (size * P(i)) ** -beta normalised by the batch maximum; beta anneals
+    to 1 by beta_increment per call. update_priorities takes the TD
+    errors returned by update_parameters for those slots.
+    """
+
+    def __init__(self, capacity, alpha=0.6, beta=0.4, beta_increment=1e-4, eps=1e-6):
+        super(PrioritizedReplayMemory, self).__init__(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+
+    def push(self, *args):
+        self.tree.update([self.position], [self.max_priority])
+        super(PrioritizedReplayMemory, self).push(*args)
+
+    def sample_index(self, batch_size):
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + np.random.random_sample(batch_size)) * segment
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+        return idx
+
+    def sample_prioritized(self, batch_size):
+        idx = self.sample_index(batch_size)
+        probs = self.tree.get(idx) / self.tree.total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        batch = self.gather(torch.from_numpy(idx))
+        return batch, idx, torch.from_numpy(weights.astype(np.float32))
+
+    def sample(self, batch_size):
+        return self.gather(torch.from_numpy(self.sample_index(batch_size)))
+
+    def update_priorities(self, idx, td_errors):
+        td = np.abs(np.asarray(td_errors, dtype=np.float64).reshape(-1))
+        priorities = (td + self.eps) ** self.alpha
+        self.tree.update(idx, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+
+class PersistentReplayMemory(ReplayMemory):
+    """ ReplayMemory whose storage is memory-mapped files in `directory`.
+
+    Every Transition field is one <field>.bin of shape (capacity,) + shape,
+    described by meta.json, and the ring position and size live in an
+    8-byte-per-value counter file. The tensors are torch.from_numpy views
+    of the maps, so push() writes straight into the page cache and the
+    counter is updated after the data. Reopening an existing directory
+    maps the files and raises ValueError if meta.json records another
+    capacity; check() compares a transition with the shapes and dtypes
+    recorded there, and the first push does it if nobody did before.
+    flush() (also every flush_every pushes) asks the kernel to write them
+    back.
+    """
+
+    META = 'meta.json'
+    COUNTER = 'counter.bin'
+
+    def __init__(self, capacity, directory, flush_every=1000):
+        super(PersistentReplayMemory, self).__init__(capacity)
+        self.directory = directory
+        self.flush_every = flush_every
+        self.maps = []
+        self.counter = None
+        self.checked = False
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, self.META)):
+            self._open()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _map(self, name, dtype, shape, mode):
+        m = np.memmap(self._path(name), dtype=dtype, mode=mode, shape=shape)
+        self.maps.append(m)
+        return m
+
+    def _open(self):
+        with open(self._path(self.META)) as f:
+            meta = json.load(f)
+        if meta['capacity'] != self.capacity:
+            raise ValueError("{} holds a replay of capacity {}, not {}; "
+                             "use another replay directory or the settings it was written with".format(
+                self.directory, meta['capacity'], self.capacity))
+        self.memory = Transition(*[
+            torch.from_numpy(self._map(field + '.bin', meta['fields'][field]['dtype'],
+                                       (self.capacity,) + tuple(meta['fields'][field]['shape']), 'r+'))
+            for field in Transition._fields])
+        self.counter = self._map(self.COUNTER, np.int64, (2,), 'r+')
+        self.position, self.size = int(self.counter[0]), int(self.counter[1])
+
+    def _allocate(self, fields):
+        meta = {'capacity': self.capacity, 'fields': {}}
+        arrays = []
+        for name, f in zip(Transition._fields, fields):
+            dtype = torch.empty(0, dtype=f.dtype).numpy().dtype
+            meta['fields'][name] = {'dtype': dtype.str, 'shape': list(f.shape)}
+            arrays.append(torch.from_numpy(self._map(name + '.bin', dtype, (self.capacity,) + tuple(f.shape), 'w+')))
+        self.memory = Transition(*arrays)
+        self.counter = self._map(self.COUNTER, np.int64, (2,), 'w+')
+        with open(self._path(self.META), 'w') as f:
+            json.dump(meta, f)
+        self.checked = True
+
+    def check(self, *args):
+        """ ValueError unless transitions like args match the stored layout """
+        if self.memory is None:
+            return
+        fields = [torch.as_tensor(a) for a in args]
+        for name, buf, f in zip(Transition._fields, self.memory, fields):
+            if tuple(buf.shape[1:]) != tuple(f.shape) or buf.dtype != f.dtype:
+                raise ValueError("{} holds {} of shape {} ({}), this run pushes {} ({}); "
+                                 "use another replay directory or the settings it was written with".format(
+                                     self.directory, name, tuple(buf.shape[1:]), buf.dtype, tuple(f.shape), f.dtype))
+        self.checked = True
+
+    def push(self, *args):
+        if not self.checked:
+            self.check(*args)
+        super(PersistentReplayMemory, self).push(*args)
+        self.counter[0] = self.position
+        self.counter[1] = self.size
+        if self.size % self.flush_every == 0 or self.position % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        for m in self.maps:
+            m.flush()
+
+
+def benchmark(capacity=1000000, batch_size=64, n=1000):
+    """ SumTree sample / update cost at capacity leaves, against ReplayMemory.sample """
+    import time
+
+    memory = PrioritizedReplayMemory(capacity)
+    memory.tree.update(np.arange(capacity), np.random.random_sample(capacity))
+    start = time.perf_counter()
+    for _ in range(n):
+        memory.tree.find((np.arange(batch_size) + np.random.random_sample(batch_size)) *
+                         memory.tree.total / batch_size)
+    t_find = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        memory.tree.update(np.random.randint(0, capacity, batch_size), np.random.random_sample(batch_size))
+    t_update = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        memory.tree.update([np.random.randint(capacity)], [1.0])
+    t_push = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    for _ in range(n):
+        random.sample(range(capacity), batch_size)
+    t_uniform = (time.perf_counter() - start) / n * 1e6
+    print("capacity {}, batch {}: sample {:.1f} us, update {:.1f} us, push {:.1f} us "
+          "(uniform random.sample {:.1f} us)".format(capacity, batch_size, t_find, t_update, t_push, t_uniform))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,83 @@
+import mmap
+import os
+import socket
+import time
+
+
+ENGINES = ('sendfile', 'mmap', 'loop')
+
+
+def send_loop(sock, fp, chunk_size):
+    """ read + send, one bytes object per chunk (original behaviour) """
+    while True:
+        buff = fp.read(chunk_size)
+        if not buff:
+            break
+        sock.sendall(buff)
+
+
+def send_mmap(sock, fp, chunk_size):
+    """ send slices of a memory mapped file, no userspace copy of the payload """
+    size = os.fstat(fp.fileno()).st_size
+    if size == 0:
+        return
+    mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        offset = 0
+        while offset < size:
+            offset += sock.send(view[offset:offset + chunk_size])
+    finally:
+        view.release()
+        mm.close()
+
+
+def send_sendfile(sock, fp, chunk_size):
+    """ kernel side copy file -> socket with os.sendfile """
+    if not hasattr(os, 'sendfile'):
+        return send_loop(sock, fp, chunk_size)
+    size = os.fstat(fp.fileno()).st_size
+    out_fd = sock.fileno()
+    in_fd = fp.fileno()
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(out_fd, in_fd, offset, chunk_size)
+        if sent == 0:
+            break
+        offset += sent
+
+
+SENDERS = {
+    'sendfile': send_sendfile,
+    'mmap': send_mmap,
+    'loop': send_loop,
+}
+
+
+def send_file(sock, fp, engine='loop', chunk_size=1024):
+    if engine not in SENDERS:
+        raise ValueError("unknown send engine: {} (choose from {})".format(engine, ', '.join(ENGINES)))
+    SENDERS[engine](sock, fp, chunk_size)
+
+
+def engine_config(cfg, engine=None):
+    """ return (engine, chunk_size) from config.ini, chunk size is per engine """
+    default_size = cfg.getint('env', 'buffer_size', fallback=1024)
+    if engine is None:
+        engine = cfg.get('sender', 'engine', fallback='loop')
+    chunk_size = cfg.getint('sender', engine + '_chunk', fallback=default_size)
+    return engine, chunk_size
+
+
+def completion_time(ip, port, filename, engine, chunk_size):
+    """ send filename over a new connection and return the completion time """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect((ip, port))
+    start_time = time.time()
+    fp = open(filename, 'rb')
+    sock.send(bytes(filename, encoding='utf8'))
+    sock.recv(16)
+    send_file(sock, fp, engine, chunk_size)
+    sock.close()
+    fp.close()
+    return time.time() - start_time
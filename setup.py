@@ -5,6 +5,6 @@ setup(name='mpsched',
           Extension('mpsched',
                     ['mpsched.c'],
                     include_dirs=['/usr/src/linux-headers-4.4.110-mptcp+/include/uapi', '/usr/src/linux-headers-4.4.110-mptcp+/include', '/usr/include/python3.5m'],
-                    define_macros=[('NUM_SUBFLOWS', '2'), ('SOL_TCP', '6')]
+                    define_macros=[('MAX_SUBFLOWS', '8'), ('SOL_TCP', '6')]
                     )
       ])
@@ -0,0 +1,244 @@
+import os
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+FIELDS = ('state', 'action', 'mask', 'next_state', 'reward')
+
+SharedSpec = namedtuple('SharedSpec', ('name', 'capacity', 'num_workers', 'shapes'))
+
+
+class SharedReplay(object):
+    """ Replay ring in one multiprocessing.shared_memory block.
+
+    The capacity is split into one partition per rollout worker. Worker w
+    is the only writer of its partition and of counts[w]: it writes the
+    transition into slot counts[w] % partition and then increments
+    counts[w], so producers never take a lock and nothing is pickled.
+    The learner reads the counters and draws only from transitions
+    older than counts[w], leaving out the `guard` oldest slots of a full
+    partition, the next ones to be overwritten. After the gather it reads
+    the counters again: a transition i whose slot a worker has started to
+    overwrite (counts[w] >= i + partition) may be torn, so it is dropped
+    and drawn again. Fields are float32, laid out per field as
+    (num_workers, partition) + shape.
+
+    The creating process owns the block and must call unlink(); workers
+    attach with SharedReplay(*spec, create=False) and only close().
+    """
+
+    def __init__(self, name, capacity, num_workers, shapes, create=True, guard=2):
+        self.num_workers = num_workers
+        self.partition = capacity // num_workers
+        self.capacity = self.partition * num_workers
+        self.shapes = {f: tuple(shapes[f]) for f in FIELDS}
+        self.guard = guard
+
+        layout = [('counts', np.int64, (num_workers,))]
+        for f in FIELDS:
+            layout.append((f, np.float32, (num_workers, self.partition) + self.shapes[f]))
+        size = 0
+        offsets = []
+        for field, dtype, shape in layout:
+            size = (size + 63) // 64 * 64
+            offsets.append(size)
+            size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+        self.owner = create
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.shm.name
+        self.arrays = {}
+        for (field, dtype, shape), offset in zip(layout, offsets):
+            self.arrays[field] = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+        self.counts = self.arrays['counts']
+        if create:
+            self.counts.fill(0)
+        self.rng = np.random.default_rng()
+
+    @property
+    def spec(self):
+        """ what a worker process needs to attach """
+        return SharedSpec(self.name, self.capacity, self.num_workers, self.shapes)
+
+    def push(self, worker, state, action, mask, next_state, reward):
+        c = int(self.counts[worker])
+        slot = c % self.partition
+        for f, value in zip(FIELDS, (state, action, mask, next_state, reward)):
+            self.arrays[f][worker, slot] = value
+        self.counts[worker] = c + 1  # publish after the data is written
+
+    def _valid(self):
+        counts = self.counts.copy()
+        return counts, np.minimum(counts, self.partition - self.guard)
+
+    def __len__(self):
+        return int(self._valid()[1].sum())
+
+    def _draw(self, batch_size):
+        """ (worker, transition number) arrays of batch_size uniformly drawn published transitions """
+        counts, valid = self._valid()
+        total = valid.sum()
+        if total < batch_size:
+            raise ValueError("only {} transitions published".format(total))
+        flat = self.rng.choice(total, batch_size, replace=False)
+        ends = np.cumsum(valid)
+        worker = np.searchsorted(ends, flat, side='right')
+        age = flat - (ends[worker] - valid[worker])  # 0 = oldest valid slot
+        return worker, counts[worker] - valid[worker] + age
+
+    def sample_index(self, batch_size):
+        """ (worker, slot) arrays of batch_size uniformly drawn published transitions """
+        worker, index = self._draw(batch_size)
+        return worker, index % self.partition
+
+    def gather(self, batch_size):
+        """ dict of field -> (batch_size,) + shape copies, none of them overwritten during the copy """
+        out = {f: np.empty((batch_size,) + self.shapes[f], dtype=np.float32) for f in FIELDS}
+        todo = np.arange(batch_size)
+        while len(todo):
+            worker, index = self._draw(len(todo))
+            slot = index % self.partition
+            for f in FIELDS:
+                out[f][todo] = self.arrays[f][worker, slot]
+            torn = self.counts[worker] >= index + self.partition  # 复制期间被worker覆盖的槽
+            todo = todo[torn]
+        return out
+
+    def sample(self, batch_size):
+        """ Transition of torch tensors laid out like ReplayMemory.sample """
+        import torch
+        from replay_memory import Transition
+
+        batch = self.gather(batch_size)
+        fields = []
+        for f in FIELDS:
+            value = torch.from_numpy(batch[f])
+            fields.append(value.view((-1,) + self.shapes[f][1:]) if len(self.shapes[f]) > 1 else value.view(-1))
+        return Transition(*fields)
+
+    def close(self):
+        self.arrays = {}
+        self.counts = None
+        self.shm.close()
+
+    def unlink(self):
+        if self.owner:
+            self.shm.unlink()
+
+
+def rollout_worker(spec, worker, policy_path, config, episodes, seed=None):
+    """ collect episodes with the latest exported NumpyPolicy into the shared ring.
+
+    Runs in its own process without torch: the learner publishes the policy
+    with numpy_policy.export_npz to policy_path and the worker reloads it
+    whenever the file changes. config holds the env settings: sim, time,
+    max_subflows and, for a real connection, ip, port, file, buffer_size,
+    engine and chunk_size; and the noise schedule: noise_scale,
+    final_noise_scale, exploration_end and first_episode, the training
+    episode the worker's first episode stands for.
+    """
+    from numpy_policy import NumpyPolicy
+    from ounoise import OUNoiseBatch, annealed_scale
+
+    memory = SharedReplay(*spec, create=False)
+    noise = OUNoiseBatch(1, 1, seed=seed)
+    policy = None
+    mtime = None
+    try:
+        for episode in range(episodes):
+            if config['sim']:
+                from simulator import SimEnv
+                my_env = SimEnv(time=config['time'], k=8, l=0.01, n=0.03, p=0.05,
+                                max_subflows=config.get('max_subflows'),
+                                seed=None if seed is None else list(seed) + [episode])
+                io = None
+            else:
+                import socket
+                import mpsched
+                from mptcp_env import env, io_thread
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.connect((config['ip'], config['port']))
+                fd = sock.fileno()
+                my_env = env(fd=fd, buff_size=config['buffer_size'], time=config['time'], k=8, l=0.01, n=0.03, p=0.05,
+                             max_subflows=config.get('max_subflows'))
+                mpsched.persist_state(fd)
+                io = io_thread(sock=sock, filename=config['file'], buffer_size=config['chunk_size'],
+                               engine=config['engine'])
+                io.start()
+
+            noise.scale = annealed_scale(config['noise_scale'], config['final_noise_scale'],
+                                         config['exploration_end'], config['first_episode'] + episode)
+            noise.reset()
+            state = my_env.reset().copy()
+            episode_reward = 0
+            while True:
+                m = os.path.getmtime(policy_path)
+                if m != mtime:
+                    policy, mtime = NumpyPolicy(policy_path), m
+                action = policy.select_action(state)
+                action += noise.noise()[0]
+                np.clip(action, policy.low, policy.high, out=action)
+                if policy.mask:
+                    action *= state[:, -1:]
+                obs, reward, count, recv_buff_size, done = my_env.step(action)
+                memory.push(worker, state, action, not done, obs, reward)
+                state[...] = obs
+                episode_reward += reward
+                if done:
+                    break
+            if io is not None:
+                io.join()
+            print("worker {} episode {}: reward {}".format(worker, episode, episode_reward))
+    finally:
+        memory.close()
+
+
+def publish(agent, path):
+    """ export_npz to a temporary file and rename it, workers never see a partial file """
+    from numpy_policy import export_npz
+
+    tmp = path + '.tmp.npz'
+    export_npz(agent, tmp)
+    os.replace(tmp, path)
+
+
+def benchmark(capacity=100000, num_workers=4, batch_size=64, n=2000):
+    """ push and sample cost against ReplayMemory """
+    import torch
+    from replay_memory import ReplayMemory
+
+    shapes = {'state': (2, 26), 'action': (2, 1), 'mask': (1,), 'next_state': (2, 26), 'reward': (1,)}
+    shared = SharedReplay(None, capacity, num_workers, shapes)
+    local = ReplayMemory(capacity)
+    s = np.random.rand(2, 26).astype(np.float32)
+    a = np.random.rand(2, 1).astype(np.float32)
+    try:
+        start = time.perf_counter()
+        for i in range(n):
+            shared.push(i % num_workers, s, a, 1.0, s, 0.5)
+        t_push = (time.perf_counter() - start) / n * 1e6
+        ts, ta = torch.from_numpy(s), torch.from_numpy(a)
+        start = time.perf_counter()
+        for i in range(n):
+            local.push(ts, ta, torch.Tensor([1]), ts, torch.FloatTensor([0.5]))
+        t_local_push = (time.perf_counter() - start) / n * 1e6
+        start = time.perf_counter()
+        for i in range(n):
+            shared.sample(batch_size)
+        t_sample = (time.perf_counter() - start) / n * 1e6
+        start = time.perf_counter()
+        for i in range(n):
+            local.sample(batch_size)
+        t_local_sample = (time.perf_counter() - start) / n * 1e6
+        print("push: shared {:.1f} us, ReplayMemory {:.1f} us".format(t_push, t_local_push))
+        print("sample({}): shared {:.1f} us, ReplayMemory {:.1f} us".format(batch_size, t_sample, t_local_sample))
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+if __name__ == '__main__':
+    benchmark()
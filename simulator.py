@@ -0,0 +1,274 @@
+import re
+import types
+
+import numpy as np
+
+from obs_window import ObservationWindow
+
+
+MSS = 1448
+
+# ETH and WIFI settings from tc.sh: tbf rate, netem delay, tbf latency
+TC_PATHS = (('7040kbit', '50ms', '50ms'), ('9185kbit', '70ms', '50ms'))
+
+_UNITS = {'': 1.0, 'k': 1e3, 'm': 1e6, 'g': 1e9}
+
+
+def parse_rate(rate):
+    """ tc rate ('7040kbit', '10mbit', '1mbps') -> bytes per second """
+    m = re.match(r'^([\d.]+)\s*([kmg]?)(bit|bps)?$', str(rate).strip().lower())
+    if m is None:
+        raise ValueError("bad rate: {}".format(rate))
+    value = float(m.group(1)) * _UNITS[m.group(2)]
+    return value if m.group(3) == 'bps' else value / 8
+
+
+def parse_time(t):
+    """ tc time ('50ms', '200us', '1s') -> seconds """
+    m = re.match(r'^([\d.]+)\s*(us|ms|s)?$', str(t).strip().lower())
+    if m is None:
+        raise ValueError("bad time: {}".format(t))
+    return float(m.group(1)) * {'us': 1e-6, 'ms': 1e-3, 's': 1.0, None: 1.0}[m.group(2)]
+
+
+class MPTCPSim(object):
+    """ num_envs independent MPTCP bulk transfers over shaped paths.
+
+    Each path is a tbf bottleneck (rate, queue limit = rate * latency)
+    behind a netem delay, like tc.sh. Every subflow runs Reno-style slow
+    start / congestion avoidance in a fluid model; a queue overflow drops
+    the excess, a random loss drops one segment, both are retransmitted,
+    counted as retransmissions and halve cwnd at most once per RTT.
+
+    The scheduler stripes the connection data over the subflows in
+    proportion to the per-subflow segment counts of the action (the
+    set_seg quota); a subflow only sends data assigned to it. Data is
+    delivered to the application in order through the shared receive
+    window: the sender assigns new data only while the connection data
+    that is not yet delivered in order fits in rwnd, and that is set by
+    the subflow lagging most behind its share (lag / share). A split that
+    does not match the path capacities therefore head-of-line blocks the
+    connection and leaves the faster subflow idle.
+
+    At every reset each instance draws its own rate and delay within
+    +-jitter of the tc.sh values and a random loss rate in [0, 2 * loss],
+    from a generator spawned from SeedSequence(seed) per instance, like
+    the noise of ounoise.py.
+
+    All state is (num_envs, paths) arrays, so one step() advances every
+    instance in a few NumPy ops per substep. Observations are built with
+    the same ObservationWindow layout as mptcp_env.env: per subflow the last
+    k ticks of segs_out delta, rtt (us) and cwnd, then [unacked,
+    retransmits]. Unacked is the number of segments in flight, retransmits
+    the count within the last tick. With max_subflows the observation is
+    padded to that many rows plus the active column, like mptcp_env.env;
+    actions of padded rows are ignored.
+    """
+
+    def __init__(self, num_envs=1, paths=TC_PATHS, file_size=256 * 2 ** 20, time=1.0, k=8,
+                 l=0.01, n=0.03, p=0.05, rwnd=4 * 2 ** 20, dt=0.005, max_subflows=None,
+                 jitter=0.1, loss=1e-4, seed=None):
+        if max_subflows is not None and max_subflows < len(paths):
+            raise ValueError("max_subflows {} < {} paths".format(max_subflows, len(paths)))
+        self.num_envs = num_envs
+        self.num_paths = len(paths)
+        self.mask = max_subflows is not None
+        self.subflows = max_subflows or len(paths)
+        self.base_rate = np.array([parse_rate(r) for r, _, _ in paths])
+        self.base_delay = np.array([parse_time(d) for _, d, _ in paths])
+        self.latency = np.array([parse_time(lat) for _, _, lat in paths])
+        self.jitter = jitter
+        self.loss = loss
+        self.rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(num_envs)]
+        self.file_size = file_size
+        self.time = time
+        self.k = k
+        self.l = l
+        self.n = n
+        self.p = p
+        self.rwnd = rwnd
+        self.substeps = max(int(round(time / dt)), 1)
+        self.dt = time / self.substeps
+
+        self.window = ObservationWindow(self.subflows, k, features=3, extra=2, batch=num_envs, mask=self.mask)
+        self.sample = np.zeros((num_envs, self.num_paths, 3))
+        self.extra = np.zeros((num_envs, 1, 2))
+        self.share = np.full((num_envs, self.num_paths), 1.0 / self.num_paths)
+
+        shape = (num_envs, self.num_paths)
+        self.rate = np.tile(self.base_rate, (num_envs, 1))
+        self.delay = np.tile(self.base_delay, (num_envs, 1))
+        self.loss_rate = np.full(shape, float(loss))
+        self.qlimit = np.maximum(self.rate * self.latency, 2 * MSS)
+        self.cwnd = np.zeros(shape)
+        self.ssthresh = np.zeros(shape)
+        self.queue = np.zeros(shape)
+        self.segs_out = np.zeros(shape)
+        self.assigned = np.zeros(shape)  ##分配给每个子流的连接数据（字节）
+        self.sent = np.zeros(shape)  ##已发出且未丢的字节
+        self.delivered = np.zeros(shape)  ##经过瓶颈到达接收端的字节
+        self.retrans = np.zeros(shape)
+        self.last_loss = np.zeros(shape)
+        self.last_segs = np.zeros(shape)
+        self.last_retrans = np.zeros(num_envs)
+        self.left = np.zeros(num_envs)
+        self.done = np.zeros(num_envs, dtype=bool)
+        self.now = 0.0
+        self.count = 1
+
+    @property
+    def observation_space(self):
+        """ per connection, like mptcp_env.env """
+        from gym import spaces
+        num_inputs = self.window.obs.shape[-1]
+        return spaces.Box(np.zeros(num_inputs), np.full(num_inputs, float("inf")))
+
+    @property
+    def action_space(self):
+        from gym import spaces
+        return spaces.Box(np.array([1]), np.array([4]))
+
+    def rtt(self):
+        return self.delay + self.queue / self.rate
+
+    def _randomize(self):
+        """ per instance rate, delay and random loss rate for the next episode """
+        draws = np.stack([rng.uniform(-1, 1, (3, self.num_paths)) for rng in self.rngs])
+        self.rate[:] = self.base_rate * (1 + self.jitter * draws[:, 0])
+        self.delay[:] = self.base_delay * (1 + self.jitter * draws[:, 1])
+        self.loss_rate[:] = self.loss * (1 + draws[:, 2])
+        self.qlimit[:] = np.maximum(self.rate * self.latency, 2 * MSS)
+
+    def _advance(self):
+        active = ~self.done[:, None]
+        if self.loss > 0:
+            uniform = np.stack([rng.random((self.substeps, self.num_paths)) for rng in self.rngs], 1)
+        for t in range(self.substeps):
+            rtt = self.rtt()
+            # 按份额分配新数据，直到按序未交付的连接数据占满接收窗口
+            outstanding = ((self.assigned - self.delivered) / self.share).max(1)
+            unassigned = self.file_size - self.assigned.sum(1)
+            new = np.clip(self.rwnd - outstanding, 0, unassigned) * ~self.done
+            self.assigned += self.share * new[:, None]
+
+            window = self.cwnd * MSS / rtt * self.dt
+            backlog = self.assigned - self.sent
+            limited = backlog < window  # 没有分到数据的子流，cwnd不增长
+            sent = np.minimum(window, backlog) * active
+            self.sent += sent
+            queue = self.queue + sent
+            served = np.minimum(queue, self.rate * self.dt)
+            queue -= served
+            drops = np.maximum(queue - self.qlimit, 0)
+            queue -= drops
+            lost = np.zeros_like(queue)
+            if self.loss > 0:
+                segs = sent / MSS
+                lost = (uniform[t] < 1 - (1 - self.loss_rate) ** segs) * np.minimum(queue, MSS)
+                queue -= lost
+            self.queue = queue
+            self.sent -= drops + lost  # 丢掉的数据重传
+
+            self.segs_out += sent / MSS
+            self.delivered += served
+            self.left -= served.sum(1)
+
+            loss = ((drops > 0) | (lost > 0)) & (self.now - self.last_loss > rtt)
+            self.retrans += np.ceil(drops / MSS) + (lost > 0)
+            self.ssthresh = np.where(loss, np.maximum(self.cwnd / 2, 2), self.ssthresh)
+            self.cwnd = np.where(loss, self.ssthresh, self.cwnd)
+            self.last_loss = np.where(loss, self.now, self.last_loss)
+
+            growth = np.where(self.cwnd < self.ssthresh, self.cwnd, 1.0) * self.dt / rtt
+            self.cwnd += np.where(loss | limited, 0, growth) * active
+            self.now += self.dt
+
+            self.done |= self.left <= 0.5
+            active = ~self.done[:, None]
+
+    def _observe(self):
+        self.sample[:, :, 0] = self.segs_out - self.last_segs
+        self.sample[:, :, 1] = self.rtt() * 1e6
+        self.sample[:, :, 2] = self.cwnd
+        self.last_segs[:] = self.segs_out
+        self.window.push(self.sample)
+
+        retrans = self.retrans.sum(1)
+        self.extra[:, 0, 0] = np.minimum(self.cwnd * MSS, self.assigned - self.delivered).sum(1) / MSS
+        self.extra[:, 0, 1] = retrans - self.last_retrans
+        self.last_retrans[:] = retrans
+        return self.window.observation(self.extra)
+
+    def reward(self):
+        rewards = self.l * self.window.series(0).sum(axis=(1, 2))
+        rewards = rewards + self.n * self.extra[:, 0, 0]
+        rewards = rewards - self.p * self.extra[:, 0, 1]
+        return rewards
+
+    def reset(self):
+        self._randomize()
+        self.window.reset()
+        self.cwnd.fill(10)
+        self.ssthresh.fill(np.inf)
+        self.queue.fill(0)
+        self.segs_out.fill(0)
+        self.assigned.fill(0)
+        self.sent.fill(0)
+        self.delivered.fill(0)
+        self.retrans.fill(0)
+        self.last_loss.fill(-np.inf)
+        self.last_segs.fill(0)
+        self.last_retrans.fill(0)
+        self.left.fill(self.file_size)
+        self.done.fill(False)
+        self.share.fill(1.0 / self.num_paths)
+        self.now = 0.0
+        self.count = 1
+        for i in range(self.k):
+            self._advance()
+            obs = self._observe()
+        return obs
+
+    def set_actions(self, actions):
+        """ actions: (num_envs, subflows, 1) or (num_envs, subflows) segment counts """
+        segs = np.asarray(actions, dtype=np.float64).reshape(self.num_envs, self.subflows)[:, :self.num_paths]
+        segs = np.clip(segs, 1e-3, None)
+        self.share = segs / segs.sum(1, keepdims=True)
+
+    def step(self, actions):
+        if actions is not None:
+            self.set_actions(actions)
+        self._advance()
+        obs = self._observe()
+        self.count = self.count + 1
+        return obs, self.reward(), self.count, self.extra[:, 0, 0], self.done.copy()
+
+
+class SimEnv(object):
+    """ Single simulated connection with the reset/step interface of mptcp_env.env """
+
+    def __init__(self, time=1.0, k=8, l=0.01, n=0.03, p=0.05, **kwargs):
+        self.sim = MPTCPSim(num_envs=1, time=time, k=k, l=l, n=n, p=p, **kwargs)
+        self.k = k
+        self.time = time
+        self.mask = self.sim.mask
+        self.subflows = self.sim.subflows
+        self.window = types.SimpleNamespace(obs=self.sim.window.obs[0])
+
+    @property
+    def observation_space(self):
+        from gym import spaces
+        num_inputs = self.window.obs.shape[-1]
+        return spaces.Box(np.zeros(num_inputs), np.full(num_inputs, float("inf")))
+
+    @property
+    def action_space(self):
+        from gym import spaces
+        return spaces.Box(np.array([1]), np.array([4]))
+
+    def reset(self):
+        return self.sim.reset()[0]
+
+    def step(self, action):
+        obs, reward, count, recv_buff_size, done = self.sim.step(np.asarray(action)[None])
+        return obs[0], float(reward[0]), count, float(recv_buff_size[0]), bool(done[0])
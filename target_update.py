@@ -0,0 +1,58 @@
+import time
+
+import torch
+
+
+def _params(target, source):
+    return [p.data for p in target.parameters()], [p.data for p in source.parameters()]
+
+
+def soft_update(target, source, tau):
+    """ target = (1 - tau) * target + tau * source, in place with one fused lerp """
+    target_params, source_params = _params(target, source)
+    with torch.no_grad():
+        if hasattr(torch, '_foreach_lerp_'):
+            torch._foreach_lerp_(target_params, source_params, tau)
+        else:
+            for target_param, param in zip(target_params, source_params):
+                target_param.lerp_(param, tau)
+
+
+def hard_update(target, source):
+    target_params, source_params = _params(target, source)
+    with torch.no_grad():
+        if hasattr(torch, '_foreach_copy_'):
+            torch._foreach_copy_(target_params, source_params)
+        else:
+            for target_param, param in zip(target_params, source_params):
+                target_param.copy_(param)
+
+
+def _copy_update(target, source, tau):
+    """ the former per-parameter update, kept for the benchmark """
+    for target_param, param in zip(target.parameters(), source.parameters()):
+        target_param.data.copy_(target_param.data * (1.0 - tau) + param.data * tau)
+
+
+def benchmark(n=2000, hidden_size=128):
+    """ time one soft update of the NAF_CNN and DDPG_CNN networks on CPU """
+    import numpy as np
+    from gym import spaces
+    from naf_cnn import Policy
+    from ddpg_cnn import Actor, Critic
+
+    action_space = spaces.Box(np.array([1]), np.array([4]))
+    for net in (Policy, Actor, Critic):
+        target = net(hidden_size, 26, action_space)
+        source = net(hidden_size, 26, action_space)
+        for name, update in (('copy', _copy_update), ('fused', soft_update)):
+            update(target, source, 0.001)
+            start = time.perf_counter()
+            for _ in range(n):
+                update(target, source, 0.001)
+            usec = (time.perf_counter() - start) / n * 1e6
+            print("{:>8} {:>6} {:8.1f} us/update".format(net.__name__, name, usec))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,87 @@
+"""
+mptcp.py 的启动测试：evaluate 在新的解释器里运行，不能导入 torch / gym / mpsched，
+并且要在限定时间内完成。
+"""
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKENDS = ('torch', 'gym', 'mpsched')
+
+# run mptcp.py as __main__, then report which backends were imported
+PROBE = """
+import runpy, sys
+sys.argv = [{script!r}] + sys.argv[1:]
+try:
+    runpy.run_path({script!r}, run_name='__main__')
+except SystemExit as e:
+    if e.code:
+        raise
+print('loaded:', ' '.join(m for m in {backends!r} if m in sys.modules))
+"""
+
+
+def run(*argv, cwd=ROOT):
+    code = PROBE.format(script=os.path.join(ROOT, 'mptcp.py'), backends=BACKENDS)
+    start = time.perf_counter()
+    p = subprocess.run([sys.executable, '-c', code] + list(argv), cwd=cwd,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    assert p.returncode == 0, p.stderr
+    loaded = p.stdout.strip().splitlines()[-1]
+    assert loaded.startswith('loaded:')
+    return p.stdout, loaded.split()[1:], elapsed
+
+
+def write_policy(path, num_inputs=26, hidden_size=8, seed=0):
+    """ a random non-CNN NAF policy in the numpy_policy.export_npz layout """
+    rng = np.random.default_rng(seed)
+    arrays = {
+        'bn0.weight': np.ones(num_inputs, dtype=np.float32),
+        'bn0.bias': np.zeros(num_inputs, dtype=np.float32),
+        'bn0.running_mean': np.zeros(num_inputs, dtype=np.float32),
+        'bn0.running_var': np.ones(num_inputs, dtype=np.float32),
+        'linear1.weight': rng.standard_normal((hidden_size, num_inputs)).astype(np.float32) * 0.1,
+        'linear1.bias': np.zeros(hidden_size, dtype=np.float32),
+        'linear2.weight': rng.standard_normal((hidden_size, hidden_size)).astype(np.float32) * 0.1,
+        'linear2.bias': np.zeros(hidden_size, dtype=np.float32),
+        'mu.weight': rng.standard_normal((1, hidden_size)).astype(np.float32) * 0.1,
+        'mu.bias': np.zeros(1, dtype=np.float32),
+        'meta.low': np.array(1), 'meta.high': np.array(4), 'meta.bn_eps': np.array(1e-5),
+        'meta.mask': np.array(False),
+    }
+    np.savez(path, **arrays)
+
+
+def test_evaluate_help_does_not_import_backends():
+    out, loaded, elapsed = run('evaluate', '--help')
+    assert '--policy' in out
+    assert loaded == []
+    assert elapsed < 5
+
+
+def test_evaluate_sim_does_not_import_backends(tmp_path):
+    policy = str(tmp_path / 'policy.npz')
+    write_policy(policy)
+    config = tmp_path / 'sim.ini'
+    config.write_text('[env]\ntime=1\n')
+    out, loaded, elapsed = run('--config', str(config), 'evaluate', '--sim', '--policy', policy,
+                               cwd=str(tmp_path))
+    assert 'Episode: 0' in out
+    assert loaded == []
+    assert elapsed < 60
+
+
+def test_train_sim_does_not_import_mpsched(tmp_path):
+    pytest.importorskip('torch')
+    config = tmp_path / 'sim.ini'
+    config.write_text('[server]\nip=127.0.0.1\nport=9000\n[file]\nfile=x\n'
+                      '[env]\nbuffer_size=1024\ntime=1\nepisode=1\n')
+    out, loaded, elapsed = run('--config', str(config), 'train', '--sim', '--algo', 'LinUCB', cwd=str(tmp_path))
+    assert 'mpsched' not in loaded
@@ -0,0 +1,66 @@
+import math
+import time
+
+
+class Ticker(object):
+    """ Deadline based tick scheduler on the monotonic clock.
+
+    Deadlines are start + n * interval, so time spent between two wait()
+    calls (getsockopt, policy, learner) is absorbed by sleeping less
+    instead of stretching the tick. If a deadline has already passed the
+    tick is an overrun; whole intervals that were missed are skipped so
+    the schedule stays on its grid. wait() returns the wake-up timestamp
+    and the real time since the previous tick.
+    """
+
+    def __init__(self, interval, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.reset()
+
+    def reset(self):
+        now = self.clock()
+        self.deadline = now
+        self.last = now
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_sum = 0.0
+        self.jitter_sq = 0.0
+        self.jitter_max = 0.0
+        return now
+
+    def wait(self):
+        self.deadline += self.interval
+        now = self.clock()
+        if now < self.deadline:
+            self.sleep(self.deadline - now)
+            now = self.clock()
+        else:
+            self.overruns += 1
+            missed = int((now - self.deadline) // self.interval)
+            self.skipped += missed
+            self.deadline += missed * self.interval
+
+        jitter = now - self.deadline
+        self.ticks += 1
+        self.jitter_sum += jitter
+        self.jitter_sq += jitter * jitter
+        self.jitter_max = max(self.jitter_max, jitter)
+
+        elapsed = now - self.last
+        self.last = now
+        return now, elapsed
+
+    def stats(self):
+        n = max(self.ticks, 1)
+        mean = self.jitter_sum / n
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_mean': mean,
+            'jitter_std': math.sqrt(max(self.jitter_sq / n - mean * mean, 0.0)),
+            'jitter_max': self.jitter_max,
+        }
@@ -3,15 +3,20 @@ import time
 import socket
 from configparser import ConfigParser
 import mpsched
+from sender import send_file, engine_config
+
+SUB_FIELDS = ('tcpi_segs_out', 'tcpi_rtt', 'tcpi_snd_cwnd')
+META_FIELDS = ('mptcpi_unacked', 'mptcpi_retransmits')
 
 
 class io_thread(threading.Thread):
 
-    def __init__(self, sock, filename, buffer_size):
+    def __init__(self, sock, filename, buffer_size, engine='loop'):
         threading.Thread.__init__(self)
         self.sock = sock
         self.buffer_size = buffer_size
         self.filename = filename
+        self.engine = engine
 
     def run(self):
         fp = open(self.filename, 'rb')
@@ -21,11 +26,7 @@ class io_thread(threading.Thread):
         buff = self.sock.recv(16)
         print(str(buff, encoding='utf8'))
 
-        while (True):
-            buff = fp.read(self.buffer_size)
-            if not buff:
-                break
-            self.sock.send(buff)
+        send_file(self.sock, fp, self.engine, self.buffer_size)
         self.sock.close()
         fp.close()
 
@@ -52,7 +53,7 @@ class env():
 
     """ adjust info to get goodput """
 
-    def adjust(self, state):
+    def adjust(self, state, mate):
         for j in range(len(state)):
             self.tp[j].pop(0)
             self.tp[j].append(state[j][0] - self.last[j][0])
@@ -61,7 +62,6 @@ class env():
             self.cwnd[j].pop(0)
             self.cwnd[j].append(state[j][2])
         self.last = state
-        mate = mpsched.get_meta_info(self.fd)
         self.recv_buff_size = mate[0]
         self.rr = mate[1] - self.rr
         return [self.tp[0] + self.rtt[0] + self.cwnd[0] + [self.recv_buff_size, self.rr],
@@ -82,12 +82,12 @@ class env():
         time.sleep(1)
 
         # 返回这个socket发送之后，所需要的各个子流的特征信息
-        self.last = mpsched.get_sub_info(self.fd)
+        self.last, _ = mpsched.get_info(self.fd, SUB_FIELDS, META_FIELDS)
 
         for i in range(self.k):
             # 遍历这k个时间片——一个state内
 
-            subs = mpsched.get_sub_info(self.fd)    # 返回fd对应的socket连接的子流信息
+            subs, _ = mpsched.get_info(self.fd, SUB_FIELDS, META_FIELDS)    # 返回fd对应的socket连接的子流信息
             for j in range(len(subs)):
                 self.tp[j].append(subs[j][0] - self.last[j][0])
                 self.rtt[j].append(subs[j][1] - self.last[j][1])
@@ -96,7 +96,7 @@ class env():
             time.sleep(self.time)
 
         # 获取未确认数和重传数
-        mate = mpsched.get_meta_info(self.fd)
+        _, mate = mpsched.get_info(self.fd, SUB_FIELDS, META_FIELDS)
         self.recv_buff_size = mate[0]
         self.rr = mate[1]
         return [self.tp[0] + self.rtt[0] + self.cwnd[0] + [self.recv_buff_size, self.rr],
@@ -108,12 +108,12 @@ class env():
         # A = [self.fd, action[0], action[1]]
         # mpsched.set_seg(A)
         time.sleep(self.time)
-        state_nxt = mpsched.get_sub_info(self.fd)
+        state_nxt, mate = mpsched.get_info(self.fd, SUB_FIELDS, META_FIELDS)  # 一次getsockopt同时取子流和元信息
         done = False
         if len(state_nxt) == 0:
             done = True
         self.count = self.count + 1
-        return self.adjust(state_nxt), self.reward(), self.count, self.recv_buff_size, done
+        return self.adjust(state_nxt, mate), self.reward(), self.count, self.recv_buff_size, done
 
 
 def main():
@@ -124,12 +124,13 @@ def main():
     PORT = cfg.getint('server', 'port')
     FILE = cfg.get('file', 'file')
     SIZE = cfg.getint('env', 'buffer_size')
+    ENGINE, CHUNK = engine_config(cfg)
     TIME = cfg.getfloat('env', 'time')
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)    # 新建socket对象，AF_INET使用IPv4套接字类型
     sock.connect((IP, PORT))    # 连接到这个端口
     fd = sock.fileno()          # 套接字的文件描述符
-    io = io_thread(sock=sock, filename=FILE, buffer_size=SIZE)  # 新建io线程，使用socket建立连接，使用SIZE大小的缓冲区发送文件FILE
+    io = io_thread(sock=sock, filename=FILE, buffer_size=CHUNK, engine=ENGINE)  # 新建io线程，使用socket建立连接，使用ENGINE以CHUNK大小的块发送文件FILE
 
     # 对套接字进行了一些设置
     mpsched.persist_state(fd)
@@ -1,138 +1,179 @@
+import os
 import threading
 import time
 import socket
 from configparser import ConfigParser
-import mpsched
+from sender import engine_config
 
 
 import argparse
-import gym
 import numpy as np
-from gym import wrappers
-from gym import spaces
-
-import torch
-from ddpg_cnn import DDPG_CNN
-from naf_cnn import NAF_CNN
-from normalized_actions import NormalizedActions
-from ounoise import OUNoise
-from replay_memory import ReplayMemory, Transition
-
-
-class io_thread(threading.Thread):
-
-    def __init__(self, sock, filename, buffer_size):
-        threading.Thread.__init__(self)
-        self.sock = sock
-        self.buffer_size = buffer_size
-        self.filename = filename
-
-    def run(self):
-        fp = open(self.filename, 'rb')
-        self.sock.send(bytes(self.filename, encoding='utf8'))
-        buff = self.sock.recv(16)
-        print(str(buff, encoding='utf8'))
-
-        while(True):
-            buff = fp.read(self.buffer_size)
-            if not buff:
+
+from ounoise import OUNoise, OUNoiseBatch, annealed_scale
+from learner import Learner
+from simulator import SimEnv, MPTCPSim
+from numpy_policy import export_npz
+
+
+def learn(agent, memory, batch_size):
+    """ one update from memory, prioritized replay also gets the new TD errors back """
+    from replay_memory import PrioritizedReplayMemory
+
+    if isinstance(memory, PrioritizedReplayMemory):
+        batch, idx, weights = memory.sample_prioritized(batch_size)
+        memory.update_priorities(idx, agent.update_parameters(batch, weights))
+    else:
+        agent.update_parameters(memory.sample(batch_size))
+
+
+def noise_scale(args, i_episode):
+    return annealed_scale(args.noise_scale, args.final_noise_scale, args.exploration_end, i_episode)
+
+
+def save_checkpoint(args, checkpointer, agent, i_episode, episodes, learner=None):
+    """ every checkpoint_every episodes and after the last training episode,
+        through the learner thread when one is training the agent """
+    if checkpointer is None:
+        return
+    last_training = i_episode + 1 >= 0.9 * episodes and i_episode < 0.9 * episodes
+    if (i_episode + 1) % args.checkpoint_every == 0 or last_training:
+        if learner is not None:
+            learner.checkpoint(checkpointer, i_episode, algo=args.algo)
+        else:
+            checkpointer.save(agent, i_episode, algo=args.algo)
+
+
+def run_vec(args, my_env, agent, memory, episodes, online, first_episode=0, checkpointer=None):
+    """ num_envs connections per episode, one policy forward pass per tick for all of them """
+    import torch
+    from replay_memory import Transition
+
+    N, S = my_env.num_envs, my_env.subflows
+    obs = torch.from_numpy(my_env.window.obs)  # (N, S, D)，与env的观测窗口共享内存
+    D = obs.size(-1)
+    noise = OUNoiseBatch(N, my_env.action_space.shape[0], seed=args.seed)
+    rewards = []
+    times = []
+    for i_episode in range(first_episode, episodes):
+        train = i_episode < 0.9 * episodes
+        noise.scale = noise_scale(args, i_episode)
+        noise.reset()
+        my_env.reset()
+        state = obs.clone()
+        next_state = obs.clone()
+        alive = np.ones(N, dtype=bool)
+        episode_reward = np.zeros(N)
+        start_time = time.time()
+        while True:
+            if online:
+                action = torch.stack([agent.select_action(state[i]) for i in range(N)])
+            else:
+                action = agent.select_action(state.view(-1, D)).view(N, S, -1)
+            if train and not online:
+                action = (action + torch.from_numpy(noise.noise()).float().view(N, 1, -1)).clamp(*agent.action_bounds)
+                if agent.mask:
+                    action.mul_(state[..., -1:])  # 补齐的子流不分配段
+            _, reward, count, _, done = my_env.step(action.numpy())
+            episode_reward += reward * alive
+            next_state.copy_(obs)
+
+            if train:
+                for i in np.flatnonzero(alive):
+                    t = (state[i], action[i], torch.Tensor([not done[i]]), next_state[i],
+                         torch.FloatTensor([float(reward[i])]))
+                    if online:
+                        agent.update_parameters(Transition(*t))
+                    else:
+                        memory.push(*t)
+                if not online and len(memory) > args.batch_size * 5:
+                    for _ in range(args.updates_per_step):
+                        learn(agent, memory, args.batch_size)
+
+            state, next_state = next_state, state
+            alive &= ~done
+            if not alive.any():
                 break
-            self.sock.send(buff)
-        self.sock.close()
-        fp.close()
-
-
-class env():
-    """ """
-    def __init__(self, fd, buff_size, time, k, l, n, p):
-        self.fd = fd
-        self.buff_size = buff_size
-        self.k = k  ##对以往k个时间段的观测
-        self.l = l  ##吞吐量的奖励因子
-        #self.m = m  ##RTT惩罚因子
-        self.n = n  ##缓冲区膨胀惩罚因子
-        self.p = p  ##重传惩罚因子
-        self.time = time
-        self.last = []
-        self.tp = [[], []]
-        self.rtt = [[], []]
-        self.cwnd = [[], []]
-        self.rr = 0
-        self.count = 1
-        self.recv_buff_size = 0
-        
-        self.observation_space = spaces.Box(np.array([0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]), np.array([float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf"),float("inf")]))
-        
-        self.action_space = spaces.Box(np.array([1]), np.array([4]))
-
-    
-    """ adjust info to get goodput """
-    def adjust(self, state):
-        for j in range(len(state)):
-            self.tp[j].pop(0)
-            self.tp[j].append(state[j][0]-self.last[j])
-            self.rtt[j].pop(0)
-            self.rtt[j].append(state[j][1])
-            self.cwnd[j].pop(0)
-            self.cwnd[j].append(state[j][2])
-        self.last = [x[0] for x in state]
-        mate = mpsched.get_meta_info(self.fd)
-        self.recv_buff_size = mate[0]
-        self.rr = mate[1] - self.rr
-        return [self.tp[0] + self.rtt[0] + self.cwnd[0] + [self.recv_buff_size, self.rr], self.tp[1] + self.rtt[1] + self.cwnd[1]+ [self.recv_buff_size, self.rr]]
-
-    def reward(self):
-        rewards = self.l * (sum(self.tp[0]) + sum(self.tp[1]))
-        #rewards = rewards - self.m * (sum(self.rtt[0]) + sum(self.rtt[1]))
-        rewards = rewards + self.n * self.recv_buff_size
-        rewards = rewards - self.p * self.rr
-        return rewards
-
-    """ reset env, return the initial state  """
-    def reset(self):
-        mpsched.persist_state(self.fd)
-        time.sleep(1)
-        self.last = [x[0] for x in mpsched.get_sub_info(self.fd)]
-
-        for i in range(self.k):
-            subs = mpsched.get_sub_info(self.fd)
-            for j in range(len(subs)):
-                 self.tp[j].append(subs[j][0]-self.last[j])
-                 self.rtt[j].append(subs[j][1])
-                 self.cwnd[j].append(subs[j][2])
-            self.last = [x[0] for x in subs]
-            time.sleep(self.time)
-        mate = mpsched.get_meta_info(self.fd)
-        self.recv_buff_size = mate[0]
-        self.rr = mate[1]
-        return [self.tp[0] + self.rtt[0] + self.cwnd[0] + [self.recv_buff_size, self.rr], self.tp[1] + self.rtt[1] + self.cwnd[1]+ [self.recv_buff_size, self.rr]]
-
-    """ action = [sub1_buff_size, sub2_buff_size] """
-    def step(self, action):
-        # A = [self.fd, action[0], action[1]]
-        # mpsched.set_seg(A)
-        time.sleep(self.time)
-        state_nxt = mpsched.get_sub_info(self.fd)
-        done = False
-        if len(state_nxt) == 0:
-            done = True
-        self.count = self.count + 1
-        return self.adjust(state_nxt), self.reward(), self.count, self.recv_buff_size, done
-
-
-def main():
+        if hasattr(my_env, 'close'):
+            my_env.close()
+        if hasattr(memory, 'flush'):
+            memory.flush()
+        if train:
+            save_checkpoint(args, checkpointer, agent, i_episode, episodes)
+        rewards.append(episode_reward)
+        if not train:
+            times.append(str(time.time() - start_time) + "\n")
+        print("Episode: {}, noise: {}, reward: {}".format(i_episode, noise.scale, episode_reward))
+        if hasattr(my_env, 'ticker'):
+            print("tick stats: {}".format(my_env.ticker.stats()))
+        fo = open("times.txt", "w")
+        fo.writelines(times)
+        fo.close()
+    return rewards
+
+
+def run_workers(args, agent, episodes, config, shapes, publish_every=50):
+    """ rollout worker processes fill a shared memory ring, this process only learns """
+    import multiprocessing
+    from shared_replay import SharedReplay, rollout_worker, publish
+
+    ctx = multiprocessing.get_context('spawn')  # 不继承torch的线程池
+    memory = SharedReplay(None, args.replay_size, args.workers, shapes)
+    policy_path = 'policy_{}.npz'.format(os.getpid())
+    publish(agent, policy_path)
+    procs = []
+    for w in range(args.workers):
+        seed = None if args.seed is None else [args.seed, w]
+        procs.append(ctx.Process(target=rollout_worker,
+                                 args=(memory.spec, w, policy_path, config, episodes, seed)))
+    for p in procs:
+        p.start()
+    updates = 0
+    try:
+        while any(p.is_alive() for p in procs):
+            if len(memory) <= args.batch_size * 5:
+                time.sleep(0.01)
+                continue
+            agent.update_parameters(memory.sample(args.batch_size))
+            updates += 1
+            if updates % publish_every == 0:
+                publish(agent, policy_path)
+    finally:
+        for p in procs:
+            p.join()
+        print("workers: {} transitions, {} updates".format(int(memory.counts.sum()), updates))
+        memory.close()
+        memory.unlink()
+        os.remove(policy_path)
+
+
+def main(argv=None, config='config.ini'):
+    # torch只在这里导入：spawn出的rollout worker会重新导入本模块
+    import torch
+    from ddpg_cnn import DDPG_CNN
+    from naf_cnn import NAF_CNN
+    from replay_memory import ReplayMemory, PrioritizedReplayMemory, PersistentReplayMemory, Transition
+    from linucb import LinUCB
+    from inference import InferencePolicy
+    from checkpoint import Checkpointer, load as load_checkpoint
+
     cfg = ConfigParser()
-    cfg.read('config.ini')
+    cfg.read(config)
 
     IP = cfg.get('server', 'ip')
     PORT = cfg.getint('server', 'port')
     FILE = cfg.get('file', 'file')
     SIZE = cfg.getint('env', 'buffer_size')
+    ENGINE, CHUNK = engine_config(cfg)
     TIME = cfg.getfloat('env', 'time')
     EPISODE = cfg.getint('env', 'episode')
+    MAX_SUBFLOWS = cfg.getint('env', 'max_subflows', fallback=None)
 
     parser = argparse.ArgumentParser(description='PyTorch REINFORCE example')
 
+    parser.add_argument('--algo', default='NAF', choices=['NAF', 'DDPG', 'LinUCB'],
+                    help='algorithm to use: NAF | DDPG | LinUCB')
+    parser.add_argument('--alpha', type=float, default=1.0, metavar='G',
+                    help='LinUCB exploration width (default: 1.0)')
     parser.add_argument('--gamma', type=float, default=0.99, metavar='G',
                     help='discount factor for reward (default: 0.99)')
     parser.add_argument('--tau', type=float, default=0.001, metavar='G',
@@ -153,88 +194,258 @@ def main():
                     help='model updates per simulator step (default: 5)')
     parser.add_argument('--batch_size', type=int, default=64, metavar='N',
                     help='batch size (default: 128)')
+    parser.add_argument('--prioritized', action='store_true',
+                    help='prioritized experience replay (NAF / DDPG)')
+    parser.add_argument('--per_alpha', type=float, default=0.6, metavar='G',
+                    help='priority exponent of prioritized replay (default: 0.6)')
+    parser.add_argument('--per_beta', type=float, default=0.4, metavar='G',
+                    help='initial importance-sampling exponent, annealed to 1 (default: 0.4)')
+    parser.add_argument('--replay_dir', default=None, metavar='DIR',
+                    help='keep the replay memory in memory-mapped files in DIR and reuse them on restart')
+    parser.add_argument('--async_learner', action='store_true',
+                    help='train in a background thread instead of between env steps')
+    parser.add_argument('--sim', action='store_true',
+                    help='use the simulated paths of simulator.py instead of a real connection')
+    parser.add_argument('--num_envs', type=int, default=1, metavar='N',
+                    help='collect from N connections (or simulator instances) per tick (default: 1)')
+    parser.add_argument('--set_seg', action='store_true',
+                    help='apply actions with mpsched.set_seg (only with --num_envs > 1)')
+    parser.add_argument('--workers', type=int, default=0, metavar='N',
+                    help='train from N rollout worker processes through shared memory (NAF / DDPG)')
+    parser.add_argument('--max_subflows', type=int, default=MAX_SUBFLOWS, metavar='N',
+                    help='pad observations to N subflows with an active mask column '
+                         '(default: max_subflows of config.ini, unset keeps 2 unpadded subflows)')
+    parser.add_argument('--seed', type=int, default=None,
+                    help='seed of the batched exploration noise and the simulated paths (default: random)')
+    parser.add_argument('--checkpoint_dir', default=None, metavar='DIR',
+                    help='write agent checkpoints to DIR from a background thread')
+    parser.add_argument('--checkpoint_every', type=int, default=10, metavar='N',
+                    help='checkpoint every N training episodes (default: 10)')
+    parser.add_argument('--resume', action='store_true',
+                    help='start from the latest checkpoint in --checkpoint_dir')
+    parser.add_argument('--evaluate', action='store_true',
+                    help='load the latest checkpoint and only run the test episodes')
+    parser.add_argument('--export', default=None, metavar='NPZ',
+                    help='write the trained policy for numpy_policy.NumpyPolicy (NAF / DDPG)')
 
+    args = parser.parse_args(argv)
+    if args.num_envs > 1 and args.async_learner:
+        parser.error("--async_learner and --num_envs > 1 cannot be combined, run_vec trains between ticks")
+    if args.num_envs > 1 and args.workers > 0:
+        parser.error("--workers and --num_envs > 1 cannot be combined, each worker runs its own env")
+    if args.num_envs > 1:
+        sock = None
+        if args.sim:
+            my_env = MPTCPSim(num_envs=args.num_envs, time=TIME, k=8, l=0.01, n=0.03, p=0.05,
+                              max_subflows=args.max_subflows, seed=args.seed)
+        else:
+            from mptcp_env import VecEnv  # 只有真实连接需要编译好的mpsched
+            my_env = VecEnv((IP, PORT), args.num_envs, FILE, time=TIME, k=8, l=0.01, n=0.03, p=0.05,
+                            engine=ENGINE, chunk_size=CHUNK, set_seg=args.set_seg,
+                            max_subflows=args.max_subflows)
+    elif args.sim:
+        sock = None
+        my_env = SimEnv(time=TIME, k=8, l=0.01, n=0.03, p=0.05, max_subflows=args.max_subflows,
+                        seed=args.seed)
+    else:
+        from mptcp_env import env
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # workers结束后才连接，见下
+        my_env = env(fd=sock.fileno(), buff_size=SIZE, time=TIME, k=8, l=0.01, n=0.03, p=0.05,
+                     max_subflows=args.max_subflows)
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((IP, PORT))
-    fd = sock.fileno()
-    my_env = env(fd=fd, buff_size=SIZE, time=TIME, k=8, l=0.01, n=0.03, p=0.05)
-    mpsched.persist_state(fd)
+    def start_io():
+        if sock is None:
+            return None
+        from mptcp_env import io_thread
+        io = io_thread(sock=sock, filename=FILE, buffer_size=CHUNK, engine=ENGINE)
+        io.start()
+        return io
 
-    args = parser.parse_args()
-    agent = NAF_CNN(args.gamma, args.tau, args.hidden_size,
-                      my_env.observation_space.shape[0], my_env.action_space)
-    memory = ReplayMemory(args.replay_size)
+    if args.algo == "LinUCB":
+        agent = LinUCB(args.alpha, my_env.observation_space.shape[0], my_env.action_space,
+                       subflows=my_env.subflows, mask=my_env.mask)
+    elif args.algo == "DDPG":
+        agent = DDPG_CNN(args.gamma, args.tau, args.hidden_size,
+                          my_env.observation_space.shape[0], my_env.action_space,
+                          subflows=my_env.subflows, k=my_env.k, mask=my_env.mask)
+    else:
+        agent = NAF_CNN(args.gamma, args.tau, args.hidden_size,
+                          my_env.observation_space.shape[0], my_env.action_space,
+                          subflows=my_env.subflows, k=my_env.k, mask=my_env.mask)
+    online = args.algo == "LinUCB"  # bandit: learn from each transition once, no replay
+
+    checkpointer = None
+    first_episode = 0
+    if (args.resume or args.evaluate) and not args.checkpoint_dir:
+        parser.error("--resume and --evaluate need --checkpoint_dir")
+    if args.checkpoint_dir:
+        checkpointer = Checkpointer(args.checkpoint_dir)
+        path = checkpointer.latest() if (args.resume or args.evaluate) else None
+        if path is not None:
+            try:
+                step, extra = load_checkpoint(agent, path, algo=args.algo)
+            except ValueError as e:
+                parser.error("{}, run with the --algo it was trained with".format(e))
+            first_episode = step + 1
+            print("resumed from {} (episode {}, {})".format(path, step, extra))
+        elif args.evaluate:
+            parser.error("no checkpoint in {}".format(args.checkpoint_dir))
+    if args.evaluate:
+        first_episode = max(first_episode, int(np.ceil(0.9 * EPISODE)))  # 只跑测试
+    if args.prioritized and args.replay_dir:
+        parser.error("--prioritized and --replay_dir cannot be combined")
+    if args.prioritized and args.workers > 0:
+        parser.error("--prioritized and --workers cannot be combined, the shared ring samples uniformly")
+    if args.replay_dir and args.workers > 0:
+        parser.error("--replay_dir and --workers cannot be combined, the workers fill a shared memory ring")
+    S, D = my_env.window.obs.shape[-2:]
+    shapes = {'state': (S, D), 'action': (S, 1), 'mask': (1,), 'next_state': (S, D), 'reward': (1,)}
+    if args.replay_dir:
+        try:
+            memory = PersistentReplayMemory(args.replay_size, args.replay_dir)
+            memory.check(*[torch.zeros(shapes[f]) for f in ('state', 'action', 'mask', 'next_state', 'reward')])
+        except ValueError as e:
+            parser.error(str(e))
+        print("replay memory: {} transitions in {}".format(len(memory), args.replay_dir))
+    elif args.prioritized:
+        memory = PrioritizedReplayMemory(args.replay_size, alpha=args.per_alpha, beta=args.per_beta)
+    else:
+        memory = ReplayMemory(args.replay_size)
+    if args.num_envs > 1:
+        run_vec(args, my_env, agent, memory, EPISODE, online, first_episode, checkpointer)
+        if checkpointer is not None:
+            checkpointer.close()
+        if args.export and not online:
+            export_npz(agent, args.export)
+        return
+
+    obs = torch.from_numpy(my_env.window.obs)  # 与env的观测窗口共享内存
     ounoise = OUNoise(my_env.action_space.shape[0])
+    learner = None
+    policy = None
+
+    if args.workers > 0 and not online and first_episode < 0.9 * EPISODE:
+        train_episodes = int(np.ceil(0.9 * EPISODE)) - first_episode
+        config = dict(sim=args.sim, time=TIME, noise_scale=args.noise_scale, final_noise_scale=args.final_noise_scale,
+                      exploration_end=args.exploration_end, first_episode=first_episode, ip=IP, port=PORT, file=FILE,
+                      buffer_size=SIZE, engine=ENGINE, chunk_size=CHUNK, max_subflows=args.max_subflows)
+        run_workers(args, agent, train_episodes, config, shapes)
+        first_episode = int(np.ceil(0.9 * EPISODE))  # 只剩测试
+        save_checkpoint(args, checkpointer, agent, first_episode - 1, EPISODE)
+
+    if sock is not None:
+        # 接收端一次只处理一个连接，本进程的连接不能挡在workers的连接前面
+        import mpsched
+        sock.connect((IP, PORT))
+        mpsched.persist_state(sock.fileno())
+
+    if args.async_learner and not online and first_episode < 0.9 * EPISODE:
+        # workers训练完后只剩测试，不再起learner
+        learner = Learner(agent, memory, args.batch_size, warmup=args.batch_size * 5,
+                          updates_per_step=args.updates_per_step)
+        learner.start()
 
     rewards = []
     times = []
-    for i_episode in range(EPISODE):
-        if (i_episode < 0.9*EPISODE):  # training
-            io = io_thread(sock=sock, filename=FILE, buffer_size=SIZE)
-            io.start()
+    try:
+        for i_episode in range(first_episode, EPISODE):
+            if (i_episode < 0.9*EPISODE):  # training
+                io = start_io()
             
-            state=my_env.reset()
+                my_env.reset()
+                state = obs.clone()
+                next_state = obs.clone()
             
-            ounoise.scale = (args.noise_scale - args.final_noise_scale) * max(0, args.exploration_end - i_episode) / args.exploration_end + args.final_noise_scale
-            ounoise.reset()
-            print(state)
-            episode_reward = 0
-            while True:
-                state = torch.FloatTensor(state)
-                #print("state: {}\n ounoise: {}".format(state, ounoise.scale))
-                action = agent.select_action(state, ounoise)
-                #print("action: {}".format(action))
-                next_state, reward, count, recv_buff_size, done = my_env.step(action)
-                #print("buff size: ",recv_buff_size)
-                #print("reward: ", reward)
-                episode_reward += reward
+                ounoise.scale = noise_scale(args, i_episode)
+                ounoise.reset()
+                print(state)
+                episode_reward = 0
+                while True:
+                    #print("state: {}\n ounoise: {}".format(state, ounoise.scale))
+                    if learner is not None:
+                        action = learner.select_action(state, ounoise)  # 最近发布的策略快照
+                    else:
+                        action = agent.select_action(state, ounoise)
+                    #print("action: {}".format(action))
+                    _, reward, count, recv_buff_size, done = my_env.step(action)
+                    #print("buff size: ",recv_buff_size)
+                    #print("reward: ", reward)
+                    episode_reward += reward
                 
-                action = torch.FloatTensor(action)
-                mask = torch.Tensor([not done])
-                next_state = torch.FloatTensor(next_state)
-                reward = torch.FloatTensor([float(reward)]) 
-                memory.push(state, action, mask, next_state, reward)
+                    action = torch.FloatTensor(action)
+                    mask = torch.Tensor([not done])
+                    next_state.copy_(obs)
+                    reward = torch.FloatTensor([float(reward)]) 
+                    if online:
+                        agent.update_parameters(Transition(state, action, mask, next_state, reward))
+                    elif learner is not None:
+                        learner.push(state, action, mask, next_state, reward)
+                    else:
+                        memory.push(state, action, mask, next_state, reward)  # push复制进预分配的存储
                 
-                state = next_state
+                    state, next_state = next_state, state
 
-                if len(memory) > args.batch_size * 5:
-                    for _ in range(args.updates_per_step):
-                        transitions = memory.sample(args.batch_size)
-                        batch = Transition(*zip(*transitions))
-                        #print("update",10*'--')
-                        agent.update_parameters(batch)
+                    if not online and learner is None and len(memory) > args.batch_size * 5:
+                        for _ in range(args.updates_per_step):
+                            #print("update",10*'--')
+                            learn(agent, memory, args.batch_size)
                     
-                if done:
-                    break
-            rewards.append(episode_reward)
-            io.join()
-        else:  # testing
-            io = io_thread(sock=sock, filename=FILE, buffer_size=SIZE)
-            io.start()
-            state=my_env.reset()
-            episode_reward = 0
-            start_time = time.time()
-            while True:
-                state = torch.FloatTensor(state)
-                #print("state: {}\n".format(state))
-                action = agent.select_action(state)
-                #print("action: {}".format(action))
-                next_state, reward, count, done = my_env.step(action)
-                episode_reward += reward
-                state = next_state
-
-                if done:
-                    break
-            rewards.append(episode_reward)
-            times.append(str(time.time() - start_time) + "\n")
-            io.join()
-        #print("Episode: {}, noise: {}, reward: {}, average reward: {}".format(i_episode, ounoise.scale, rewards[-1], np.mean(rewards[-100:])))
-        fo = open("times.txt", "w")
-        fo.writelines(lines)
-        fo.close()
-            
-    sock.close()
+                    if done:
+                        break
+                rewards.append(episode_reward)
+                if io is not None:
+                    io.join()
+                if hasattr(memory, 'flush'):
+                    memory.flush()
+                save_checkpoint(args, checkpointer, agent, i_episode, EPISODE, learner)
+                if hasattr(my_env, 'ticker'):
+                    print("tick stats: {}".format(my_env.ticker.stats()))
+            else:  # testing
+                if learner is not None:
+                    learner.stop()
+                    learner = None
+                if policy is None:
+                    # 测试阶段策略不再更新，用冻结、trace过的副本做决策
+                    policy = agent if online else InferencePolicy(agent, obs)
+                if hasattr(policy, 'latency'):
+                    policy.latency.reset()  # 每个测试episode单独统计
+                io = start_io()
+                my_env.reset()
+                episode_reward = 0
+                start_time = time.time()
+                while True:
+                    #print("state: {}\n".format(obs))
+                    action = policy.select_action(obs)
+                    #print("action: {}".format(action))
+                    _, reward, count, recv_buff_size, done = my_env.step(action)
+                    episode_reward += reward
+
+                    if done:
+                        break
+                rewards.append(episode_reward)
+                times.append(str(time.time() - start_time) + "\n")
+                if io is not None:
+                    io.join()
+                if hasattr(policy, 'latency'):
+                    print("decision latency: {}".format(policy.latency.stats()))
+            #print("Episode: {}, noise: {}, reward: {}, average reward: {}".format(i_episode, ounoise.scale, rewards[-1], np.mean(rewards[-100:])))
+            fo = open("times.txt", "w")
+            fo.writelines(times)
+            fo.close()
+    finally:
+        if learner is not None:  # daemon线程在torch op中途被杀会abort
+            learner.stop()
+            learner = None
+
+    if checkpointer is not None:
+        checkpointer.close()
+
+    if args.export and not online:
+        export_npz(agent, args.export)
+        print("policy exported to {}".format(args.export))
+
+    if sock is not None:
+        sock.close()
 
 
 if __name__ == '__main__':
@@ -1,17 +1,20 @@
+import argparse
 import threading
 import time
 import socket
 from configparser import ConfigParser
 import mpsched
+from sender import ENGINES, send_file, engine_config
 
 
 class io_thread(threading.Thread):
 
-    def __init__(self, sock, filename, buffer_size):
+    def __init__(self, sock, filename, buffer_size, engine='loop'):
         threading.Thread.__init__(self)
         self.sock = sock
         self.buffer_size = buffer_size
         self.filename = filename
+        self.engine = engine
 
     def run(self):
         fp = open(self.filename, 'rb')
@@ -19,11 +22,7 @@ class io_thread(threading.Thread):
         buff = self.sock.recv(16)
         print(str(buff, encoding='utf8'))
 
-        while(True):
-            buff = fp.read(self.buffer_size)
-            if not buff:
-                break
-            self.sock.send(buff)
+        send_file(self.sock, fp, self.engine, self.buffer_size)
         self.sock.close()
         fp.close()
 
@@ -63,19 +62,34 @@ def main():
     SIZE = cfg.getint('env', 'buffer_size')
     timestep = cfg.getfloat('env', 'time')
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((IP, PORT))
-    fd = sock.fileno()
+    parser = argparse.ArgumentParser(description='completion time of one file transfer')
+    parser.add_argument('--engine', default=None, choices=ENGINES + ('all',),
+                        help='send engine, "all" compares every engine (default: config.ini)')
+    args = parser.parse_args()
 
-    io = io_thread(sock=sock, filename='./256mb.dat', buffer_size=SIZE)
-    
+    engines = ENGINES if args.engine == 'all' else (args.engine,)
+    times = []
+    for engine in engines:
+        engine, chunk_size = engine_config(cfg, engine)
 
-    start_time = time.time()
-    io.start()
-    io.join();
-   
-    end_time = time.time()
-    print("completion time: ", end_time - start_time)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((IP, PORT))
+        fd = sock.fileno()
+
+        io = io_thread(sock=sock, filename='./256mb.dat', buffer_size=chunk_size, engine=engine)
+
+        start_time = time.time()
+        io.start()
+        io.join()
+
+        end_time = time.time()
+        times.append((engine, chunk_size, end_time - start_time))
+        print("engine: {}, chunk: {}, completion time: {}".format(engine, chunk_size, end_time - start_time))
+
+    if len(times) > 1:
+        base = times[-1][2]
+        for engine, chunk_size, t in times:
+            print("{:>8} {:>8} {:10.3f}s {:6.2f}x".format(engine, chunk_size, t, base / t))
 
 
 if __name__ == '__main__':